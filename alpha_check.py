@@ -1,63 +1,203 @@
 import logging
 import time
-from auth_utils import global_sign_in, setup_logging, retry_request
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from auth_utils import API_BASE, get_client, setup_logging
+from check_state import CheckStateStore, ERROR, FAIL, PASS, SUBMITTED, parse_date
+from pnl_cache import PnlCache, SelfCorrelation
+from result_store import ResultStore
 
-def submit_alpha(alpha_id):
+RESULT_STORE     = None
+CLIENT           = None
+SELF_CORRELATION = None
+CHECK_STATE      = None
+
+def record_state(alpha_id, outcome, failed=None):
+    if CHECK_STATE:
+        CHECK_STATE.record(alpha_id, outcome, failed)
+
+def is_unsubmitted(alpha_id):
+    # 候选可能来自状态库中保存的旧 Alpha 数据，提交前重新获取状态，已经提交过的 Alpha 不再提交
+    result = CLIENT.request_json("GET", f"{API_BASE}/alphas/{alpha_id}")
+    if result is None:
+        logging.error(f"Get Alpha {alpha_id} Status Fail, Skip Submit.")
+        record_state(alpha_id, ERROR)
+        return False
+    status = result.get("status")
+    if status == 'UNSUBMITTED':
+        return True
+    logging.info(f"Alpha {alpha_id} status: {status}, Already Submitted, Skip Submit.")
+    if RESULT_STORE:
+        RESULT_STORE.update_status(alpha_id, status)
+    record_state(alpha_id, SUBMITTED)
+    return False
+
+def post_submit(alpha_id):
+    base_url = f"{API_BASE}/alphas/{alpha_id}"
+    CLIENT.post(f"{base_url}/submit")
+
+def wait_alpha_active(alpha_id):
     max_wait_time  = 600
     check_interval = 30
     elapsed_time   = 0
-    base_url       = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
-    retry_request(SESS.post, f"{base_url}/submit")
+    base_url       = f"{API_BASE}/alphas/{alpha_id}"
     while elapsed_time < max_wait_time:
-        result = retry_request(SESS.get, f"{base_url}")
+        result = CLIENT.request_json("GET", base_url)
         if result is None:
             logging.warning(f"Get Alpha {alpha_id} Status returned None. Retrying in {check_interval} seconds...")
         elif result.get("status") == 'ACTIVE':
             logging.info(f"Alpha {alpha_id} Submit SUCCEED.")
+            if RESULT_STORE:
+                RESULT_STORE.update_status(alpha_id, 'ACTIVE')
+            record_state(alpha_id, SUBMITTED)
             return True
         else:
             logging.info(f"Alpha {alpha_id} status: {result.get('status', 'UNKNOWN')}. Retrying in {check_interval} seconds...")
         time.sleep(check_interval)
         elapsed_time += check_interval
 
-    if retry_request(SESS.patch, base_url, json={"color": None}):
+    record_state(alpha_id, ERROR)
+    if CLIENT.request_json("PATCH", base_url, json={"color": None}):
         logging.info(f"Alpha {alpha_id} Submit FAIL, Clear Alpha Color.")
     else:
         logging.warning(f"Alpha {alpha_id} Submit FAIL, Clear Alpha Color Fail.")
     return False
 
-def check_alpha_submission(alpha_id):
-    base_url = f"https://api.worldquantbrain.com/alphas/{alpha_id}"
-    if retry_request(SESS.patch, base_url, json={"color": "YELLOW"}):
-        logging.info(f"Mark Alpha {alpha_id} in YELLOW, Reset SELF_CORRELATION to PENDING.")
-    else:
-        logging.error(f"Mark Alpha {alpha_id} in YELLOW Fail, Skip this Alpha.")
+def submit_alpha(alpha_id):
+    if not is_unsubmitted(alpha_id):
         return False
+    post_submit(alpha_id)
+    return wait_alpha_active(alpha_id)
+
+def mark_alpha(alpha_id):
+    base_url = f"{API_BASE}/alphas/{alpha_id}"
+    if CLIENT.request_json("PATCH", base_url, json={"color": "YELLOW"}):
+        logging.info(f"Mark Alpha {alpha_id} in YELLOW, Reset SELF_CORRELATION to PENDING.")
+        return True
+    logging.error(f"Mark Alpha {alpha_id} in YELLOW Fail, Skip this Alpha.")
+    record_state(alpha_id, ERROR)
+    return False
 
-    result = retry_request(SESS.get, f"{base_url}/check", delay=30)
+def check_alpha(alpha_id):
+    base_url = f"{API_BASE}/alphas/{alpha_id}"
+    result = CLIENT.wait_json(f"{base_url}/check")
     if result is None:
         logging.error(f"Get Alpha {alpha_id} IS CHECK Status Fail, Skip this Alpha.")
+        record_state(alpha_id, ERROR)
         return False
 
     checks = result["is"]["checks"]
     fail_check = [item for item in checks if item['result'] == 'FAIL']
     for item in fail_check:
         logging.info(f"Alpha {alpha_id} Check Submission FAIL Item: {item}")
+    passed = all(check.get("result") == "PASS" for check in checks)
+    # 没有 FAIL 项但有 PENDING / WARNING 项时结果还不确定，记为 ERROR 下次重新检查
+    record_state(alpha_id, PASS if passed else FAIL if fail_check else ERROR, [item.get("name") for item in fail_check])
 
-    if all(check.get("result") == "PASS" for check in checks):
-        if retry_request(SESS.patch, base_url, json={"color": "BLUE"}):
+    if passed:
+        if CLIENT.request_json("PATCH", base_url, json={"color": "BLUE"}):
             logging.info(f"Alpha {alpha_id} Check Submission PASS, Mark Alpha in BLUE.")
         else:
             logging.warning(f"Alpha {alpha_id} Check Submission PASS, But Mark Alpha in BLUE Fail.")
         return True
     else:
-        if retry_request(SESS.patch, base_url, json={"color": None}):
+        if CLIENT.request_json("PATCH", base_url, json={"color": None}):
             logging.info(f"Alpha {alpha_id} Check Submission FAIL, Clear Alpha Color.")
         else:
             logging.warning(f"Alpha {alpha_id} Check Submission FAIL, Clear Alpha Color Fail.")
         return False
 
-def get_alpha_list():
+def check_alpha_submission(alpha_id):
+    return mark_alpha(alpha_id) and check_alpha(alpha_id)
+
+class CheckPipeline:
+    """
+    Check / Submit 流水线：mark -> check -> submit -> wait 四个阶段各自使用有界线程池，
+    一个 Alpha 完成当前阶段后立即进入下一阶段的线程池，所有请求通过共享的 BrainClient 限流。
+    日志和返回结果与逐个处理时相同，返回列表保持输入顺序。
+
+    :param submit : 是否在 Check 通过后提交
+    :param workers: 各阶段的线程数，例如 {"mark": 8, "check": 8, "submit": 2, "wait": 8}
+    """
+    STAGES = ["mark", "check", "submit", "wait"]
+
+    def __init__(self, submit: bool = False, workers: dict = None):
+        self.submit  = submit
+        workers      = {"mark": 8, "check": 8, "submit": 2, "wait": 8, **(workers or {})}
+        self.pools   = {stage: ThreadPoolExecutor(max_workers=workers[stage], thread_name_prefix=stage) for stage in self.STAGES}
+        self.lock    = threading.Lock()
+        self.done    = threading.Event()
+        self.passed  = {}
+        self.pending = 0
+        self.count   = 0
+
+    def run(self, alpha_list):
+        self.total   = len(alpha_list)
+        self.pending = self.total
+        if not alpha_list:
+            self.done.set()
+        for index, alpha in enumerate(alpha_list, start=1):
+            self.advance("mark", index, alpha)
+        self.done.wait()
+        for pool in self.pools.values():
+            pool.shutdown()
+        return [alpha for index, alpha in enumerate(alpha_list, start=1) if self.passed.get(index)]
+
+    def advance(self, stage, index, alpha):
+        self.pools[stage].submit(self.run_stage, stage, index, alpha)
+
+    def run_stage(self, stage, index, alpha):
+        alpha_id = alpha.get("id")
+        try:
+            if stage == "mark":
+                logging.info(f"+[{index:04d}/{self.total:04d}] Alpha id: {alpha_id} Start Check Submission" + "-"*72 + "+")
+                next_stage = "check" if mark_alpha(alpha_id) else None
+            elif stage == "check":
+                passed     = check_alpha(alpha_id)
+                next_stage = "submit" if passed and self.submit else None
+                self.passed[index] = passed and not self.submit
+            elif stage == "submit":
+                next_stage = None
+                if is_unsubmitted(alpha_id):
+                    post_submit(alpha_id)
+                    next_stage = "wait"
+            else:
+                self.passed[index] = wait_alpha_active(alpha_id)
+                next_stage = None
+        except Exception as e:
+            logging.error(f"Alpha {alpha_id} {stage} stage failed: {e}")
+            record_state(alpha_id, ERROR)
+            next_stage = None
+
+        if next_stage:
+            self.advance(next_stage, index, alpha)
+        else:
+            self.finish(index, alpha)
+
+    def finish(self, index, alpha):
+        with self.lock:
+            if self.passed.get(index):
+                self.count += 1
+            if self.submit:
+                logging.info(f"Currently {self.count} Alphas Submited.")
+            else:
+                logging.info(f"Currently {self.count} Alphas PASS Check Submission.")
+            logging.info("+" + "-"*124 + "+")
+            self.pending -= 1
+            if self.pending == 0:
+                self.done.set()
+
+def get_local_alpha_list():
+    # 从本地结果库筛选，条件与 get_alpha_list 的 API 筛选条件一致
+    return RESULT_STORE.query(status="UNSUBMITTED", fitness_min=1, sharpe_min=1.25, turnover_min=0.01, turnover_max=0.7, exclude_fail=False)
+
+def get_api_alpha_list(since: str = None):
+    """
+    分页获取符合筛选条件的 UNSUBMITTED Alpha。按 -dateCreated 排序，
+    传入 since (上次运行记录的 dateCreated 高水位) 时只返回更晚创建的 Alpha，遇到不晚于它的 Alpha 即停止分页。
+    """
+    since               = parse_date(since)
     status_filter       = "UNSUBMITTED"
     fitness_filter      = "is.fitness%3E1"
     sharpe_filter       = "is.sharpe%3E1.25"
@@ -66,22 +206,65 @@ def get_alpha_list():
     alpha_filtered_list = []
     offset              = 0
     limit               = 100
-    base_url            = "http://api.worldquantbrain.com"
+    base_url            = API_BASE
     while True:
         path   = f"/users/self/alphas?limit={limit}&offset={offset}&{alpha_filter}"
         url    = f"{base_url}{path}"
-        result = retry_request(SESS.get, url)
+        result = CLIENT.request_json("GET", url)
         if result:
             alphas = result.get("results", [])
-            alpha_filtered_list.extend(alphas)
+            if since is not None:
+                newer = [alpha for alpha in alphas if not alpha.get("dateCreated") or parse_date(alpha["dateCreated"]) > since]
+                alpha_filtered_list.extend(newer)
+                if len(newer) < len(alphas):
+                    break
+            else:
+                alpha_filtered_list.extend(alphas)
             count   = result.get("count", 0)
             offset += limit
             if offset >= count:
                 break
         else:
             raise RuntimeError(f"Request to {url} Failed.")
+    return alpha_filtered_list
 
-    alpha_nofaile_list = []
+def get_submitted_alpha_ids():
+    # 已提交 (ACTIVE) 的 Alpha 数量较少，每次完整分页获取 id，PnL 只拉取本地缓存中没有的
+    alpha_ids = []
+    offset    = 0
+    limit     = 100
+    while True:
+        url    = f"{API_BASE}/users/self/alphas?limit={limit}&offset={offset}&status=ACTIVE&order=-dateCreated"
+        result = CLIENT.request_json("GET", url)
+        if not result:
+            raise RuntimeError(f"Request to {url} Failed.")
+        alpha_ids.extend(alpha["id"] for alpha in result.get("results", []))
+        offset += limit
+        if offset >= result.get("count", 0):
+            break
+    return alpha_ids
+
+def precheck_self_correlation(alpha_list, submit: bool = False):
+    """
+    用本地 PnL 缓存估计每个候选与已提交 Alpha 的最大自相关，超过阈值的候选不再 mark / check。
+    提交模式下同一批中先通过的候选也加入比较集合。
+    """
+    SELF_CORRELATION.set_submitted(get_submitted_alpha_ids())
+    passed, rejected = SELF_CORRELATION.screen(alpha_list, greedy=submit)
+    for alpha_id, (value, other) in rejected.items():
+        logging.info(f"Alpha {alpha_id} Local SELF_CORRELATION {value} with {other} > {SELF_CORRELATION.threshold}, Skip Check Submission.")
+        record_state(alpha_id, FAIL, ["SELF_CORRELATION"])
+    logging.info("+" + "="*124 + "+")
+    logging.info(f"{len(passed)} Alphas Passed Local SELF_CORRELATION Precheck against {len(SELF_CORRELATION.submitted)} Submitted Alphas.")
+    logging.info("+" + "="*124 + "+")
+    return passed
+
+def get_alpha_list(submit: bool = False):
+    if RESULT_STORE:
+        alpha_filtered_list = get_local_alpha_list()
+    else:
+        alpha_filtered_list = get_api_alpha_list(since=CHECK_STATE.high_water_mark if CHECK_STATE else None)
+    alpha_nofaile_list  = []
     for alpha in alpha_filtered_list:
         is_checks = alpha.get("is", {}).get("checks", None)
         if is_checks and 'FAIL' not in str(is_checks):
@@ -90,22 +273,22 @@ def get_alpha_list():
     logging.info("+" + "="*124 + "+")
     logging.info(f"{len(alpha_filtered_list)} Alphas Passed Filter (Sharpe>1.25, Fitness>1, 70>Turnover>1).")
     logging.info(f"{len(alpha_nofaile_list)} Alphas IS CHECKS No FAIL, Waiting to Check Submission")
+    if CHECK_STATE:
+        # 新获取的 Alpha 记为 PENDING，再加上之前记录的 PENDING / ERROR / 可重试的失败 / 需要重新检查的 PASS
+        CHECK_STATE.add_alphas(alpha_nofaile_list)
+        alpha_ids          = {alpha["id"] for alpha in alpha_nofaile_list}
+        alpha_nofaile_list = CHECK_STATE.eligible(alpha_nofaile_list, submit) + \
+                             [alpha for alpha in CHECK_STATE.eligible_alphas(submit) if alpha["id"] not in alpha_ids]
+        logging.info(f"{len(alpha_nofaile_list)} Alphas New or Eligible for Re-check.")
+        CHECK_STATE.log_counts()
     logging.info("+" + "="*124 + "+")
     return alpha_nofaile_list
 
-def get_checked_alphas():
-    alpha_list          = get_alpha_list()
-    total_alphas        = len(alpha_list)
-    alpha_checked_list  = []
-    alpha_checked_count = 0
-    for index, alpha in enumerate(alpha_list, start=1):
-        alpha_id = alpha.get("id")
-        logging.info(f"+[{index:04d}/{total_alphas:04d}] Alpha id: {alpha_id} Start Check Submission" + "-"*72 + "+")
-        if check_alpha_submission(alpha_id):
-            alpha_checked_count += 1
-            alpha_checked_list.append(alpha)
-        logging.info(f"Currently {alpha_checked_count} Alphas PASS Check Submission.")
-        logging.info("+" + "-"*124 + "+")
+def get_checked_alphas(workers: dict = None):
+    alpha_list         = get_alpha_list()
+    if SELF_CORRELATION:
+        alpha_list     = precheck_self_correlation(alpha_list)
+    alpha_checked_list = CheckPipeline(submit=False, workers=workers).run(alpha_list)
 
     logging.info("+" + "-" * 32 + "+")
     for alpha in alpha_checked_list:
@@ -113,20 +296,11 @@ def get_checked_alphas():
     logging.info("+" + "-" * 32 + "+")
     return alpha_checked_list
 
-def get_submited_alphas():
-    alpha_list           = get_alpha_list()
-    total_alphas         = len(alpha_list)
-    alpha_submited_list  = []
-    alpha_submited_count = 0
-    for index, alpha in enumerate(alpha_list, start=1):
-        alpha_id = alpha.get("id")
-        logging.info(f"+[{index:04d}/{total_alphas:04d}] Alpha id: {alpha_id} Start Check Submission" + "-"*72 + "+")
-        if check_alpha_submission(alpha_id):
-            if submit_alpha(alpha_id):
-                alpha_submited_count += 1
-                alpha_submited_list.append(alpha)
-        logging.info(f"Currently {alpha_submited_count} Alphas Submited.")
-        logging.info("+" + "-"*124 + "+")
+def get_submited_alphas(workers: dict = None):
+    alpha_list          = get_alpha_list(submit=True)
+    if SELF_CORRELATION:
+        alpha_list      = precheck_self_correlation(alpha_list, submit=True)
+    alpha_submited_list = CheckPipeline(submit=True, workers=workers).run(alpha_list)
 
     logging.info("+" + "-" * 19 + "+")
     for alpha in alpha_submited_list:
@@ -135,7 +309,29 @@ def get_submited_alphas():
     return alpha_submited_list
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="filter candidates from the local result store instead of paging the API")
+    parser.add_argument("--result-db", type=str, default='alpha_results.db')
+    parser.add_argument("--check-workers", type=int, default=8, help="concurrent alphas in the mark/check stages")
+    parser.add_argument("--submit-workers", type=int, default=2, help="concurrent alphas in the submit stage")
+    parser.add_argument("--rate", type=float, default=5, help="shared request rate limit (requests per second)")
+    parser.add_argument("--precheck", action="store_true", help="skip candidates whose local PnL self-correlation exceeds the threshold")
+    parser.add_argument("--pnl-db", type=str, default='alpha_pnl.db')
+    parser.add_argument("--self-corr-threshold", type=float, default=0.7)
+    parser.add_argument("--state-db", type=str, default='alpha_check_state.db')
+    parser.add_argument("--retry-days", type=float, default=7, help="days before re-checking correlation failures and passed alphas")
+    parser.add_argument("--full", action="store_true", help="ignore the check state: page every candidate and re-check all of them")
+    args = parser.parse_args()
+
     setup_logging(log_file='check.log')
-    SESS       = global_sign_in()
-    get_checked_alphas()
-    #get_submited_alphas()
+    CLIENT     = get_client(rate=args.rate, capacity=args.rate * 2)
+    if args.local:
+        RESULT_STORE = ResultStore(args.result_db)
+    if not args.full:
+        CHECK_STATE  = CheckStateStore(args.state_db, retry_interval=args.retry_days * 86400)
+    if args.precheck:
+        SELF_CORRELATION = SelfCorrelation(PnlCache(CLIENT, args.pnl_db, max_workers=args.check_workers), threshold=args.self_corr_threshold)
+    WORKERS    = {"mark": args.check_workers, "check": args.check_workers, "submit": args.submit_workers, "wait": args.check_workers}
+    get_checked_alphas(WORKERS)
+    #get_submited_alphas(WORKERS)
+    CLIENT.log_stats()
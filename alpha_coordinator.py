@@ -0,0 +1,157 @@
+import argparse
+import json
+import logging
+import signal
+import threading
+import time
+from datetime import datetime
+from pytz import timezone
+from auth_utils import BrainClient, setup_logging
+from alpha_simulator import AlphaSimulator, MAX_MULTI_SIZE
+from alpha_dedupe import FingerprintIndex
+from result_store import ResultStore
+
+class ShardWorker(AlphaSimulator):
+    """
+    单个账号的模拟 worker，从共享队列取 Alpha。
+    共享队列为空时从其他 worker 的本地缓存中窃取一半 (work stealing)。
+    """
+    def __init__(self, coordinator, username: str, max_concurrent: int, **kwargs):
+        self.coordinator = coordinator
+        self.username    = username
+        self.buffer_lock = threading.Lock()
+        self.completed   = 0
+        self.started_at  = time.time()
+        super().__init__(max_concurrent, owner=username, **kwargs)
+
+    def handle_exit(self, signum, frame):
+        self.coordinator.handle_exit(signum, frame)
+
+    def active_owners(self):
+        return self.coordinator.owners
+
+    def read_alphas_from_csv_in_batches(self):
+        batch = super().read_alphas_from_csv_in_batches()
+        if not batch:
+            batch = self.coordinator.steal(self)
+        return batch
+
+    def next_simulation_batch(self):
+        with self.buffer_lock:
+            return super().next_simulation_batch()
+
+    def release_queued_alphas(self):
+        with self.buffer_lock:
+            super().release_queued_alphas()
+
+    def write_results(self, results):
+        super().write_results(results)
+        self.completed += len(results)
+
+    def throughput(self):
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "completed": self.completed,
+            "alphas_per_hour": round(self.completed * 3600 / elapsed, 1),
+            "in_flight": len(self.active_simulations),
+            "buffered": len(self.sim_queue_ls),
+        }
+
+class SimulationCoordinator:
+    """
+    多账号模拟协调器：每个凭据一个 worker 线程，共用同一个 SQLite 队列、去重索引和结果库。
+    凭据文件格式：[["user1", "pass1"], ["user2", "pass2", 8], ...]，第三项为该账号的并发数 (可选)。
+
+    :param credential_file: 多账号凭据文件
+    :param max_concurrent : 默认的每账号并发数
+    :param report_interval: 输出各账号吞吐量的间隔 (秒)
+    """
+    def __init__(self, credential_file: str = 'brain_credentials.json', max_concurrent: int = 10, multi_size: int = 1,
+                 alpha_list_file: str = 'alphas_pending_simulated.csv', queue_db: str = 'alphas_queue.db',
+                 fingerprint_db: str = 'alpha_fingerprints.db', result_db: str = 'alpha_results.db', report_interval: float = 300):
+        with open(credential_file) as f:
+            accounts = json.load(f)
+
+        self.lock            = threading.Lock()
+        self.report_interval = report_interval
+        self.terminate       = False
+        fingerprints         = FingerprintIndex(fingerprint_db)
+        result_store         = ResultStore(result_db)
+        self.workers         = []
+        self.owners          = [account[0] for account in accounts]
+        for account in accounts:
+            username, password = account[0], account[1]
+            concurrency        = account[2] if len(account) > 2 else max_concurrent
+            client             = BrainClient(credentials=(username, password), pool_size=concurrency * 2 + 4)
+            self.workers.append(ShardWorker(self, username, concurrency, alpha_list_file=alpha_list_file, queue_db=queue_db,
+                                            multi_size=multi_size, client=client, fingerprints=fingerprints, result_store=result_store))
+        signal.signal(signal.SIGINT, self.handle_exit)
+        signal.signal(signal.SIGTERM, self.handle_exit)
+
+    def handle_exit(self, signum, frame):
+        logging.info(f"Received {signal.Signals(signum).name}. Stopping all accounts...")
+        self.terminate = True
+        for worker in self.workers:
+            AlphaSimulator.handle_exit(worker, signum, frame)
+
+    def steal(self, thief):
+        """
+        从本地缓存最多的 worker 中取走一半。只尝试非阻塞加锁，避免两个 worker 互相窃取时死锁。
+        """
+        with self.lock:
+            victims = sorted((w for w in self.workers if w is not thief), key=lambda w: len(w.sim_queue_ls), reverse=True)
+            for victim in victims:
+                if len(victim.sim_queue_ls) < 2 or not victim.buffer_lock.acquire(blocking=False):
+                    continue
+                try:
+                    half = len(victim.sim_queue_ls) // 2
+                    stolen, victim.sim_queue_ls = victim.sim_queue_ls[half:], victim.sim_queue_ls[:half]
+                finally:
+                    victim.buffer_lock.release()
+                logging.info(f"{thief.username} stole {len(stolen)} alphas from {victim.username}.")
+                return stolen
+        return []
+
+    def run_worker(self, worker):
+        try:
+            worker.manage_simulations()
+        except Exception as e:
+            logging.error(f"Worker {worker.username} stopped with error: {e}")
+        finally:
+            worker.drain()
+
+    def report(self):
+        total = 0
+        for worker in self.workers:
+            stats  = worker.throughput()
+            total += stats["completed"]
+            logging.info(f"Account {worker.username}: {stats}")
+        logging.info(f"All accounts: {total} alphas completed, queue: {self.workers[0].queue.counts()}")
+
+    def run(self):
+        threads = [threading.Thread(target=self.run_worker, args=(worker,), name=worker.username) for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        last_report = time.time()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+            if time.time() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.time()
+        self.report()
+        logging.info("All active simulations processed. Exiting safely.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--credentials", type=str, default='brain_credentials.json')
+    parser.add_argument("--max-concurrent", type=int, default=10)
+    parser.add_argument("--multi-size", type=int, default=1, choices=range(1, MAX_MULTI_SIZE + 1), metavar="1-10")
+    parser.add_argument("--report-interval", type=float, default=300)
+    args = parser.parse_args()
+
+    setup_logging(log_file='simulation.log', log_to_file=True, log_to_console=False, mode='a')
+    logging.info(f"Current time in Eastern: {datetime.now(timezone('US/Eastern')).strftime('%Y-%m-%d %H:%M:%S')}")
+    coordinator = SimulationCoordinator(args.credentials, max_concurrent=args.max_concurrent, multi_size=args.multi_size,
+                                        report_interval=args.report_interval)
+    coordinator.run()
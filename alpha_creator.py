@@ -1,7 +1,15 @@
+import argparse
 import csv
+import logging
 import random
-import pandas as pd
-from auth_utils import global_sign_in
+import time
+from auth_utils import get_client
+from alpha_queue import AlphaQueue, LEASED, PENDING, SUBMITTED
+from alpha_dedupe import FingerprintIndex, QUEUED
+from alpha_prescreen import Panel, Prescreener, prescreen_alphas
+from datafield_catalog import DataFieldCatalog
+from result_store import ResultStore
+from search_space import BanditSampler, load_search_space
 
 # Alpha Setting
 INSTRUMENTTYPE = 'EQUITY'
@@ -22,91 +30,239 @@ TESTPERIOD     = 'P2Y'
 DATASET_FILED = 'fundamental6'
 DATASET_TYPE  = 'MATRIX'
 
-def get_datafields(sess, instrument_type: str, region: str, delay: int, universe: str, dataset_filed: str, search: str=''):
-    if len(search) == 0:
-        url_template = "https://api.worldquantbrain.com/data-fields?" +\
-            f"&instrumentType={instrument_type}" +\
-            f"&region={region}&delay={str(delay)}&universe={universe}&dataset.id={dataset_filed}&limit=50" +\
-            "&offset={x}"
-        count = sess.get(url_template.format (x=0)).json()['count']
-    else:
-        url_template = "https://api.worldquantbrain.com/data-fields?" +\
-            f"&instrumentType={instrument_type}" +\
-            f"&region={region}&delay={str(delay)}&universe={universe}&limit=50" +\
-            f"&search={search}" +\
-            "&offset={x}"
-        count = 100
-
-    datafields_list = []
-    for x in range(0, count, 50):
-        datafields = sess.get (url_template. format (x=x))
-        datafields_list.append (datafields. json()['results'])
-
-    datafields_list_flat = [item for sublist in datafields_list for item in sublist]
-    datafields_df        = pd.DataFrame(datafields_list_flat)
-    return datafields_df
-
-def create_alpha():
-    datafields = get_datafields(SESS, instrument_type = INSTRUMENTTYPE,region=REGION, universe=UNIVERSE, delay=DELAY, dataset_filed = DATASET_FILED)
-    company_datafields = datafields[datafields['type'] == DATASET_TYPE]["id"].tolist()
-    alpha_expressions    = []
-
-    group_compare_ops = ['group_rank', 'group_zscore', 'group_neutralize']
-    ts_compare_ops1   = ['ts_rank', 'ts_zscore', 'ts_av_diff', 'ts_mean']
-    ts_compare_ops2   = ['ts_decay_exp_window', 'ts_decay_linear']
-    group_types       = ['market', 'industry', 'subindustry', 'sector']
-    market_metrics    = ['adv20','cap','returns','volume','vwap']
-    lookback_periods  = [60, 120, 240]
-
-    for gco in group_compare_ops:
-        for tco1 in ts_compare_ops1:
-            for tco2 in ts_compare_ops2:
-                for cmp_fund in company_datafields:
-                    for grp in group_types:
-                        # 计算分析师情绪的偏离程度
-                        analyst_sentiment_deviation = f"mdl110_analyst_sentiment - {tco1}(mdl110_analyst_sentiment, 60)"
-                        # 指数衰减平滑处理，强化近期情绪变化趋势
-                        smoothed_sentiment_trend = f"{tco2}({analyst_sentiment_deviation}, 20)"
-                        # 计算成交量的市场排名
-                        volume_rank = f"rank({cmp_fund})"
-                        # 计算最终信号（情绪趋势 × 成交量排名）
-                        combined_signal = f"{smoothed_sentiment_trend} * {volume_rank}"
-                        # 行业中性化，去除行业影响
-                        alpha_expression = f"{gco}({combined_signal}, {grp})"
-                        alpha_expressions.append(alpha_expression)
-
-    print(f'there are total {len(alpha_expressions)} alpha expressions')
-    alpha_list = []
-
-    for alpha_expression in alpha_expressions:
-        simulation_data = {
-            'type': 'REGULAR',
-            'settings': {
-                'instrumentType': INSTRUMENTTYPE,
-                'region': REGION,
-                'universe': UNIVERSE,
-                'delay': DELAY,
-                'decay': DECAY,
-                'neutralization': NEUTRALIZATION,
-                'truncation': TRUNCATION,
-                'pasteurization': PASTEURIZATION,
-                'unitHandling': UNITHANDLING,
-                'nanHandling': NANHANDLING,
-                'language': LANGUAGE,
-                'visualization': VISUALIZATION,
-                'testPeriod': TESTPERIOD
-            },
-            'regular': alpha_expression
-        }
-        alpha_list.append(simulation_data)
-    random.shuffle(alpha_list)
-    return alpha_list
+# Datafield Cache
+DATAFIELD_CACHE_DIR = 'datafield_cache'
+DATAFIELD_CACHE_TTL = 24 * 3600
 
-if __name__ == "__main__":
-    SESS            = global_sign_in()
-    ALPHA_LIST      = create_alpha()
+# Search Space (模板和参数取值)
+SEARCH_SPACE_FILE = 'search_space.json'
+
+# Prescreen Panel (本地预筛选使用的数据面板)
+PRESCREEN_PANEL_DIR = 'prescreen_panel'
+
+def get_datafields(client, instrument_type: str, region: str, delay: int, universe: str, dataset_filed: str, search: str='', refresh: bool=False):
+    # BrainClient 只在缓存未命中需要请求时才登录
+    catalog = DataFieldCatalog(client, cache_dir=DATAFIELD_CACHE_DIR, ttl=DATAFIELD_CACHE_TTL)
+    return catalog.get(instrument_type, region, delay, universe, dataset_filed, search, refresh=refresh)
+
+def shuffled_indices(n: int, seed=None, small_n: int = 65536):
+    """
+    惰性生成 range(n) 的随机排列，不需要在内存中构造完整列表。
+    n 较小时直接打乱下标；否则在 2^(2k) >= n 的空间上用 6 轮 Feistel 网络构造双射，
+    超出 n 的值通过 cycle-walking 跳过。
+    :param n      : 排列长度
+    :param seed   : 随机种子，相同的种子得到相同的顺序
+    :param small_n: 不超过该长度时直接在内存中打乱
+    """
+    if n <= 0:
+        return
+    rng = random.Random(seed)
+    if n <= small_n:
+        yield from rng.sample(range(n), n)
+        return
+
+    half_bits = max(1, ((n - 1).bit_length() + 1) // 2)
+    mask      = (1 << half_bits) - 1
+    keys      = [rng.getrandbits(64) for _ in range(6)]
+    mask64    = (1 << 64) - 1
+
+    def round_function(x, key):
+        # splitmix64 混合函数
+        z = (x + key) & mask64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask64
+        return (z ^ (z >> 31)) & mask
+
+    for x in range(1 << (2 * half_bits)):
+        left, right = x >> half_bits, x & mask
+        for key in keys:
+            left, right = right, left ^ round_function(right, key)
+        y = (left << half_bits) | right
+        if y < n:
+            yield y
+
+def iter_product_shuffled(dimensions, seed=None):
+    """
+    以均匀随机的顺序惰性遍历多个列表的笛卡尔积，每次产出一个组合 tuple。
+    """
+    sizes = [len(dim) for dim in dimensions]
+    total = 1
+    for size in sizes:
+        total *= size
+    for index in shuffled_indices(total, seed):
+        combination = []
+        for dim, size in zip(reversed(dimensions), reversed(sizes)):
+            index, pos = divmod(index, size)
+            combination.append(dim[pos])
+        yield tuple(reversed(combination))
+
+def alpha_settings():
+    return {
+        'instrumentType': INSTRUMENTTYPE,
+        'region': REGION,
+        'universe': UNIVERSE,
+        'delay': DELAY,
+        'decay': DECAY,
+        'neutralization': NEUTRALIZATION,
+        'truncation': TRUNCATION,
+        'pasteurization': PASTEURIZATION,
+        'unitHandling': UNITHANDLING,
+        'nanHandling': NANHANDLING,
+        'language': LANGUAGE,
+        'visualization': VISUALIZATION,
+        'testPeriod': TESTPERIOD
+    }
 
-    with open('alphas_pending_simulated.csv', 'w', newline='') as output_file:
+def load_datafield_ids(spec):
+    """
+    把搜索空间配置中的 {"datafields": {...}} 展开为数据字段 id 列表。
+    spec 可包含 dataset (默认 DATASET_FILED)、type (默认 DATASET_TYPE) 和 search。
+    """
+    datafields = get_datafields(CLIENT, instrument_type=INSTRUMENTTYPE, region=REGION, universe=UNIVERSE, delay=DELAY,
+                                dataset_filed=spec.get('dataset', DATASET_FILED), search=spec.get('search', ''))
+    field_type = spec.get('type', DATASET_TYPE)
+    return datafields[datafields['type'] == field_type]["id"].tolist() if field_type else datafields["id"].tolist()
+
+def load_templates(space_file: str = SEARCH_SPACE_FILE):
+    return load_search_space(space_file, alpha_settings(), load_datafield_ids)
+
+def create_alpha(seed=None, fingerprints=None, space_file: str = SEARCH_SPACE_FILE):
+    """
+    生成器：按搜索空间配置中的模板依次以随机顺序逐个产出待模拟的 Alpha，内存占用与组合总数无关。
+    传入 fingerprints 时跳过已经入队或模拟过的 表达式 + settings 组合。
+    """
+    templates = load_templates(space_file)
+    total     = sum(len(template) for template in templates)
+    print(f'there are total {total} alpha expressions')
+
+    for template in templates:
+        for values in iter_product_shuffled(template.dimensions, seed):
+            alpha_expression = template.render(values)
+            if fingerprints is not None and fingerprints.contains(alpha_expression, template.settings):
+                continue
+            yield {
+                'type': 'REGULAR',
+                'settings': template.settings,
+                'regular': alpha_expression
+            }
+
+def write_alphas_to_queue(alphas, queue, chunk_size: int = 1000, fingerprints=None):
+    """
+    分块写入待模拟队列，每个分块提交后 Simulator 即可开始模拟，不必等待生成结束。
+    传入 fingerprints 时把写入的 Alpha 记为 QUEUED。
+    """
+    total, chunk = 0, []
+    for alpha in alphas:
+        chunk.append(alpha)
+        if len(chunk) >= chunk_size:
+            total += queue.put_many(chunk)
+            if fingerprints is not None:
+                fingerprints.add_alphas(chunk, QUEUED)
+            chunk = []
+    total += queue.put_many(chunk)
+    if fingerprints is not None:
+        fingerprints.add_alphas(chunk, QUEUED)
+    return total
+
+def write_alphas_bandit(sampler, queue, budget: int, round_size: int = 200, fingerprints=None, poll_interval: float = 60,
+                        prescreener=None):
+    """
+    按模拟结果分轮次生成 Alpha：每轮根据结果库更新 sampler，写入 round_size 个 Alpha，
+    等待这一轮至少一半的 Alpha 的模拟结果出现在结果库中后再开始下一轮，使后面的预算参考前面的结果。
+    队列中已没有待模拟或进行中的 Alpha 时 (其余被去重或模拟失败) 不再等待。
+    传入 prescreener 时每轮采样的 Alpha 先经过本地预筛选，被拒绝的不占用预算。
+    """
+    total = 0
+    while total < budget:
+        sampler.refresh()
+        alphas = sampler.sample(min(round_size, budget - total))
+        if not alphas:
+            logging.info("Search space exhausted.")
+            break
+        if prescreener is not None:
+            sampled        = len(alphas)
+            alphas, reject = prescreener.screen(alphas)
+            logging.info(f"Prescreened {sampled} sampled alphas: {len(alphas)} accepted, rejected {reject}.")
+            if not alphas:
+                continue
+        total += write_alphas_to_queue(alphas, queue, fingerprints=fingerprints)
+        logging.info(f"{total}/{budget} alphas queued. Best values so far: {sampler.report(top=3)}")
+        codes  = {alpha["regular"] for alpha in alphas}
+        needed = max(len(codes) // 2, 1)
+        while total < budget:
+            finished = sampler.result_store.count_codes(codes)
+            if finished >= needed:
+                break
+            counts = queue.counts()
+            if counts[PENDING] + counts[LEASED] + counts[SUBMITTED] == 0:
+                logging.info(f"Queue drained with {finished}/{len(codes)} results of this round, starting the next round.")
+                break
+            logging.info(f"Waiting for results: {finished}/{needed} of this round simulated.")
+            time.sleep(poll_interval)
+    return total
+
+def write_alphas_to_csv(alphas, csv_file: str, chunk_size: int = 1000, fingerprints=None):
+    """
+    写入旧格式的待模拟 CSV。传入 fingerprints 时把写入的 Alpha 分块记为 QUEUED (写入文件后再记录)。
+    """
+    total, chunk = 0, []
+    with open(csv_file, 'w', newline='') as output_file:
         dict_writer = csv.DictWriter(output_file, fieldnames=['type', 'settings', 'regular'])
         dict_writer.writeheader()
-        dict_writer.writerows(ALPHA_LIST)
+        for alpha in alphas:
+            dict_writer.writerow(alpha)
+            chunk.append(alpha)
+            total += 1
+            if len(chunk) >= chunk_size:
+                output_file.flush()
+                if fingerprints is not None:
+                    fingerprints.add_alphas(chunk, QUEUED)
+                chunk = []
+    if fingerprints is not None:
+        fingerprints.add_alphas(chunk, QUEUED)
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", choices=["queue", "csv"], default="queue")
+    parser.add_argument("--queue-db", type=str, default='alphas_queue.db')
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--fingerprint-db", type=str, default='alpha_fingerprints.db')
+    parser.add_argument("--search-space", type=str, default=SEARCH_SPACE_FILE)
+    parser.add_argument("--sampler", choices=["grid", "bandit"], default="grid", help="grid: every combination in random order; bandit: guided by simulated results")
+    parser.add_argument("--budget", type=int, default=10000, help="number of alphas to generate with the bandit sampler")
+    parser.add_argument("--round-size", type=int, default=200, help="alphas per bandit round")
+    parser.add_argument("--result-db", type=str, default='alpha_results.db')
+    parser.add_argument("--prescreen", action="store_true", help="drop degenerate / highly correlated alphas on a local panel before queueing")
+    parser.add_argument("--panel-dir", type=str, default=PRESCREEN_PANEL_DIR)
+    parser.add_argument("--synthetic-panel", action="store_true", help="generate synthetic data for fields missing from the panel (structural checks only)")
+    parser.add_argument("--max-correlation", type=float, default=0.9, help="prescreen rank correlation threshold")
+    parser.add_argument("--max-turnover", type=float, default=0.7, help="prescreen turnover upper bound")
+    parser.add_argument("--max-references", type=int, default=2000, help="most recent accepted / pending alphas kept for the prescreen correlation check")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    CLIENT       = get_client()
+    FINGERPRINTS = FingerprintIndex(args.fingerprint_db)
+    QUEUE        = AlphaQueue(args.queue_db)
+    PRESCREENER  = None
+    if args.prescreen:
+        PRESCREENER = Prescreener(Panel(args.panel_dir, synthetic=args.synthetic_panel), max_correlation=args.max_correlation,
+                                  max_turnover=args.max_turnover, max_references=args.max_references)
+        # pending_alphas 按入队时间倒序返回，反转后最近入队的 Alpha 最后被替换
+        pending     = QUEUE.pending_alphas(args.max_references)[::-1]
+        logging.info(f"Prescreen references: {PRESCREENER.add_reference(pending)} pending alphas.")
+    if args.sampler == "bandit":
+        sampler = BanditSampler(load_templates(args.search_space), ResultStore(args.result_db), FINGERPRINTS, seed=args.seed)
+        count   = write_alphas_bandit(sampler, QUEUE, args.budget, args.round_size, fingerprints=FINGERPRINTS, prescreener=PRESCREENER)
+        print(f'{count} alphas written to {args.queue_db}')
+    else:
+        alphas = create_alpha(args.seed, FINGERPRINTS, args.search_space)
+        if PRESCREENER is not None:
+            alphas = prescreen_alphas(alphas, PRESCREENER)
+        if args.output == "queue":
+            count = write_alphas_to_queue(alphas, QUEUE, fingerprints=FINGERPRINTS)
+            print(f'{count} alphas written to {args.queue_db}')
+        else:
+            count = write_alphas_to_csv(alphas, 'alphas_pending_simulated.csv', fingerprints=FINGERPRINTS)
+            print(f'{count} alphas written to alphas_pending_simulated.csv')
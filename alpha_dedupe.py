@@ -0,0 +1,167 @@
+import ast
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+QUEUED    = 'QUEUED'
+SIMULATED = 'SIMULATED'
+
+def normalize_expression(expression):
+    """
+    规范化 Alpha 表达式：兼容 /alphas/{id} 返回的 {'code': ...} 格式，并去掉所有空白字符。
+    """
+    if isinstance(expression, str) and expression.startswith('{'):
+        try:
+            expression = ast.literal_eval(expression)
+        except (ValueError, SyntaxError):
+            pass
+    if isinstance(expression, dict):
+        expression = expression.get('code', '')
+    return re.sub(r'\s+', '', expression or '')
+
+def fingerprint(expression, settings=None):
+    """
+    计算 表达式 + settings 的指纹 (16 字节)。
+    settings 为 None 时只按表达式计算，用于没有记录 settings 的历史结果。
+    """
+    key = normalize_expression(expression)
+    if settings is not None:
+        if isinstance(settings, str):
+            settings = ast.literal_eval(settings)
+        key += '\x00' + json.dumps(settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+class FingerprintIndex:
+    """
+    持久化的 Alpha 去重索引。
+    指纹保存在 SQLite 中，启动时全部加载到内存字典，成员查询为 O(1)。
+    状态只会从 QUEUED 升级为 SIMULATED；只有已提交但无法取回结果、放回队列重新模拟的 Alpha 通过 requeue_many 回退为 QUEUED。
+
+    :param db_path: SQLite 数据库文件路径
+    """
+    def __init__(self, db_path: str = 'alpha_fingerprints.db'):
+        self.db_path = db_path
+        self.lock    = threading.Lock()
+        self.conn    = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fingerprints (fp BLOB PRIMARY KEY, state TEXT NOT NULL) WITHOUT ROWID")
+        self.states  = dict(self.conn.execute("SELECT fp, state FROM fingerprints"))
+
+    def __len__(self):
+        return len(self.states)
+
+    def state(self, expression, settings=None):
+        state = self.states.get(fingerprint(expression, settings))
+        if state is None and settings is not None:
+            state = self.states.get(fingerprint(expression))
+        return state
+
+    def contains(self, expression, settings=None):
+        return self.state(expression, settings) is not None
+
+    def is_simulated(self, expression, settings=None):
+        return self.state(expression, settings) == SIMULATED
+
+    def add_many(self, items, state: str):
+        """
+        批量写入指纹，items 为 (expression, settings) 的可迭代对象。
+        """
+        rows = []
+        for expression, settings in items:
+            fp = fingerprint(expression, settings)
+            if self.states.get(fp) in (state, SIMULATED):
+                continue
+            rows.append((fp, state))
+        if not rows:
+            return 0
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT INTO fingerprints (fp, state) VALUES (?, ?) "
+                "ON CONFLICT(fp) DO UPDATE SET state = excluded.state WHERE excluded.state = 'SIMULATED'", rows)
+            self.conn.execute("COMMIT")
+            for fp, state in rows:
+                if self.states.get(fp) != SIMULATED:
+                    self.states[fp] = state
+        return len(rows)
+
+    def requeue_many(self, items):
+        """
+        把 (expression, settings) 的指纹从 SIMULATED 回退为 QUEUED，返回回退数量。
+        """
+        fps = [fp for fp in (fingerprint(expression, settings) for expression, settings in items) if self.states.get(fp) == SIMULATED]
+        if not fps:
+            return 0
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("UPDATE fingerprints SET state = ? WHERE fp = ?", [(QUEUED, fp) for fp in fps])
+            self.conn.execute("COMMIT")
+            for fp in fps:
+                self.states[fp] = QUEUED
+        return len(fps)
+
+    def add_alphas(self, alphas, state: str):
+        return self.add_many(((alpha['regular'], alpha['settings']) for alpha in alphas), state)
+
+    def build(self, simulated_csv: str = 'alphas_simulated.csv', pending_csv: str = 'alphas_pending_simulated.csv', queue_db: str = 'alphas_queue.db', chunk_size: int = 10000):
+        """
+        从已有文件回填索引：
+        - alphas_simulated.csv 没有 settings 列，按表达式记为 SIMULATED
+        - alphas_pending_simulated.csv 记为 QUEUED
+        - 队列中已提交或已完成的记为 SIMULATED，其余记为 QUEUED
+        """
+        def chunks(rows):
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            yield chunk
+
+        def read_csv(csv_file):
+            try:
+                with open(csv_file, 'r', newline='') as file:
+                    yield from csv.DictReader(file)
+            except FileNotFoundError:
+                return
+
+        total = 0
+        for chunk in chunks((row['regular'], None) for row in read_csv(simulated_csv) if row.get('regular')):
+            total += self.add_many(chunk, SIMULATED)
+        for chunk in chunks((row['regular'], row['settings']) for row in read_csv(pending_csv)):
+            total += self.add_many(chunk, QUEUED)
+
+        if os.path.exists(queue_db):
+            conn = sqlite3.connect(f"file:{queue_db}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("SELECT regular, settings, status FROM alphas")
+                for chunk in chunks(rows):
+                    total += self.add_many(((regular, json.loads(settings)) for regular, settings, status in chunk if status in ('DONE', 'SUBMITTED')), SIMULATED)
+                    total += self.add_many(((regular, json.loads(settings)) for regular, settings, status in chunk if status not in ('DONE', 'SUBMITTED')), QUEUED)
+            finally:
+                conn.close()
+        logging.info(f"Fingerprint index built: {total} new entries, {len(self)} total.")
+        return total
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build", "stats"])
+    parser.add_argument("--db", type=str, default='alpha_fingerprints.db')
+    parser.add_argument("--simulated-csv", type=str, default='alphas_simulated.csv')
+    parser.add_argument("--pending-csv", type=str, default='alphas_pending_simulated.csv')
+    parser.add_argument("--queue-db", type=str, default='alphas_queue.db')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    index = FingerprintIndex(args.db)
+    if args.command == "build":
+        index.build(args.simulated_csv, args.pending_csv, args.queue_db)
+    print(f"{len(index)} fingerprints in {args.db}")
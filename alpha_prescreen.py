@@ -0,0 +1,543 @@
+import hashlib
+import logging
+import os
+import re
+from collections import Counter, OrderedDict
+from functools import lru_cache
+import numpy as np
+
+GROUP_NAMES = ['market', 'sector', 'industry', 'subindustry']
+
+class Panel:
+    """
+    本地 日期 x 股票 数据面板，每个字段保存为 panel_dir/{field}.npy (float32, T x N)，以内存映射方式读取。
+    行业分组保存为 panel_dir/{group}.npy (int, N)。
+    目录中没有的字段默认抛出 KeyError (Prescreener 直接放行使用了该字段的表达式)。
+    synthetic=True 时缺失的字段和分组按名称在内存中生成确定性的合成数据 (每日更新的随机游走，不写入目录)，
+    用到的名称记录在 synthetic_names 中。合成数据与真实数据的换手率、覆盖率和相关性无关，
+    Prescreener 对用到合成数据的表达式只做结构性检查 (解析错误、常数输出)。
+
+    :param panel_dir  : 数据目录
+    :param days       : 合成数据的天数
+    :param instruments: 合成数据的股票数
+    :param synthetic  : 是否为缺失的字段生成合成数据
+    """
+    def __init__(self, panel_dir: str = 'prescreen_panel', days: int = 512, instruments: int = 400, synthetic: bool = False):
+        self.panel_dir       = panel_dir
+        self.days            = days
+        self.instruments     = instruments
+        self.synthetic       = synthetic
+        self.synthetic_names = set()
+        self.fields          = {}
+        self.groups          = {}
+
+    def rng(self, name):
+        return np.random.default_rng(int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], 'little'))
+
+    def load(self, name, generate):
+        path = os.path.join(self.panel_dir, f"{name}.npy")
+        if os.path.exists(path):
+            return np.load(path, mmap_mode='r')
+        if not self.synthetic:
+            raise KeyError(name)
+        self.synthetic_names.add(name)
+        return generate(self.rng(name))
+
+    def field(self, name):
+        if name not in self.fields:
+            self.fields[name] = self.load(name, self.synthetic_field)
+            self.days, self.instruments = self.fields[name].shape
+        return self.fields[name]
+
+    def group(self, name):
+        if name not in self.groups:
+            self.groups[name] = GroupIndex(self.load(name, lambda rng: self.synthetic_group(name)))
+        return self.groups[name]
+
+    def synthetic_field(self, rng):
+        # 每日更新，避免低频更新的合成字段让表达式看起来像常数
+        values = np.cumsum(rng.standard_normal((self.days, self.instruments)), axis=0) + rng.standard_normal(self.instruments) * 5
+        return values.astype(np.float32)
+
+    def synthetic_group(self, name):
+        # 分组之间保持嵌套关系：subindustry -> industry -> sector
+        rng         = self.rng('subindustry')
+        subindustry = rng.integers(0, 150, self.instruments)
+        return {'market': np.zeros(self.instruments, dtype=np.int16), 'sector': subindustry % 11,
+                'industry': subindustry % 60, 'subindustry': subindustry}[name].astype(np.int16)
+
+class GroupIndex:
+    """
+    预先计算分组编号，分组求和是一次按 (行, 分组) 编号的 bincount，回填是按编号取列；
+    position 为按分组排序后每一列在所属分组内的位置，用于分组内排名。
+    """
+    def __init__(self, groups):
+        groups        = np.asarray(groups)
+        ids, codes    = np.unique(groups, return_inverse=True)
+        sizes         = np.bincount(codes)
+        starts        = np.r_[0, np.cumsum(sizes)[:-1]]
+        self.count    = len(ids)
+        self.sizes    = sizes.astype(np.float64)
+        self.codes    = codes.astype(np.int16 if self.count < 2 ** 15 else np.int64)
+        self.position = (np.arange(len(codes)) - starts[np.sort(codes)]).astype(np.float32)
+        self.keys     = {}
+
+    def reduce(self, x):
+        rows = len(x)
+        if rows not in self.keys:
+            self.keys[rows] = (np.arange(rows)[:, None] * self.count + self.codes).ravel()
+        return np.bincount(self.keys[rows], weights=np.asarray(x, dtype=np.float64).ravel(), minlength=rows * self.count).reshape(rows, self.count)
+
+    def expand(self, values):
+        return values[:, self.codes]
+
+def tokenize(expression):
+    for number, name, symbol in re.findall(r'\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?)|([A-Za-z_][A-Za-z0-9_.]*)|(\S))', expression):
+        if number:
+            yield ('num', float(number))
+        elif name:
+            yield ('name', name)
+        else:
+            yield ('sym', symbol)
+
+class Parser:
+    """
+    FASTEXPR 子集的递归下降解析器：函数调用 (支持 key=value 参数)、字段名、数字、+ - * / 和括号。
+    节点为 tuple，第一项为节点类型，节点的 repr 即规范化的表达式，用作子表达式缓存的键。
+    """
+    def __init__(self, expression: str):
+        self.tokens   = list(tokenize(expression))
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, symbol=None):
+        token = self.peek()
+        if symbol is not None and token != ('sym', symbol):
+            raise SyntaxError(f"Expected '{symbol}' at token {self.position}, got {token[1]}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.expr()
+        if self.position != len(self.tokens):
+            raise SyntaxError(f"Unexpected token {self.peek()[1]}")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek() in (('sym', '+'), ('sym', '-')):
+            op   = self.take()[1]
+            node = ('op', op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek() in (('sym', '*'), ('sym', '/')):
+            op   = self.take()[1]
+            node = ('op', op, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() == ('sym', '-'):
+            self.take()
+            return ('neg', self.unary())
+        return self.atom()
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == 'num':
+            return ('num', value)
+        if kind == 'sym' and value == '(':
+            node = self.expr()
+            self.take(')')
+            return node
+        if kind != 'name':
+            raise SyntaxError(f"Unexpected token {value}")
+        if self.peek() != ('sym', '('):
+            return ('var', value)
+        self.take('(')
+        args, kwargs = [], []
+        while self.peek() != ('sym', ')'):
+            if self.peek()[0] == 'name' and self.position + 1 < len(self.tokens) and self.tokens[self.position + 1] == ('sym', '='):
+                key = self.take()[1]
+                self.take('=')
+                kwargs.append((key, self.expr()))
+            else:
+                args.append(self.expr())
+            if self.peek() == ('sym', ','):
+                self.take()
+        self.take(')')
+        return ('call', value, tuple(args), tuple(kwargs))
+
+@lru_cache(maxsize=4096)
+def parse_expression(expression: str):
+    # 节点都是 tuple，缓存的语法树可以安全共享
+    return Parser(expression).parse()
+
+def node_names(node):
+    # 表达式中引用的所有字段和分组名称
+    if node[0] == 'var':
+        return {node[1]}
+    if node[0] == 'neg':
+        return node_names(node[1])
+    if node[0] == 'op':
+        return node_names(node[2]) | node_names(node[3])
+    if node[0] == 'call':
+        return set().union(*(node_names(arg) for arg in node[2]), *(node_names(value) for _, value in node[3]))
+    return set()
+
+def pad_front(values, total):
+    # 滚动窗口前 d-1 天没有完整窗口，补 NaN
+    return np.concatenate([np.full((total - len(values), values.shape[1]), np.nan), values]).astype(np.float32)
+
+def rolling_sum(x, d):
+    cumsum = np.cumsum(np.concatenate([np.zeros((1, x.shape[1])), x.astype(np.float64)]), axis=0)
+    return cumsum[d:] - cumsum[:-d]
+
+def cs_rank(x):
+    # 横截面排名，映射到 [0, 1]，NaN 保持 NaN
+    mask  = np.isnan(x)
+    order = np.argsort(np.where(mask, np.inf, x), axis=1)
+    ranks = np.empty(x.shape, dtype=np.float32)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(x.shape[1], dtype=np.float32), x.shape), axis=1)
+    count = (~mask).sum(axis=1, keepdims=True)
+    ranks /= np.maximum(count - 1, 1)
+    ranks[mask] = np.nan
+    return ranks
+
+class ExpressionEvaluator:
+    """
+    在 Panel 上向量化计算 FASTEXPR 表达式，返回 T x N 的 float32 数组。
+    支持 rank、ts_rank、ts_zscore、ts_mean、ts_av_diff、ts_decay_linear、ts_decay_exp_window、
+    group_rank、group_zscore、group_neutralize 和四则运算。
+    每个节点只计算最后 rows 天：时间序列算子向子节点多要 d - 1 天用于窗口预热，其余算子沿用父节点的天数。
+    子表达式的结果按 (节点, 天数) 缓存 (LRU)，同一批表达式共享的部分只计算一次。
+
+    :param panel     : Panel
+    :param cache_size: 缓存的子表达式结果数量
+    """
+    def __init__(self, panel, cache_size: int = 128):
+        self.panel      = panel
+        self.cache_size = cache_size
+        self.cache      = OrderedDict()
+        self.functions  = {
+            'rank': self.rank, 'ts_rank': self.ts_rank, 'ts_zscore': self.ts_zscore, 'ts_mean': self.ts_mean,
+            'ts_av_diff': self.ts_av_diff, 'ts_decay_linear': self.ts_decay_linear, 'ts_decay_exp_window': self.ts_decay_exp_window,
+            'group_rank': self.group_rank, 'group_zscore': self.group_zscore, 'group_neutralize': self.group_neutralize,
+        }
+
+    TS_FUNCTIONS = {'ts_rank', 'ts_zscore', 'ts_mean', 'ts_av_diff', 'ts_decay_linear', 'ts_decay_exp_window'}
+
+    def evaluate(self, expression: str, rows: int = None):
+        """
+        计算表达式最后 rows 天的值 (默认全部天数)。
+        """
+        return self.eval_node(parse_expression(expression), rows or self.panel.days)
+
+    def eval_node(self, node, rows):
+        kind = node[0]
+        if kind == 'num':
+            return node[1]
+        if kind == 'var':
+            name = node[1]
+            return self.panel.group(name) if name in GROUP_NAMES else self.panel.field(name)[-rows:]
+        key = (node, rows)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if kind == 'neg':
+            result = -self.eval_node(node[1], rows)
+        elif kind == 'op':
+            lhs, rhs = self.eval_node(node[2], rows), self.eval_node(node[3], rows)
+            if np.ndim(lhs) and np.ndim(rhs):
+                length   = min(len(lhs), len(rhs))
+                lhs, rhs = lhs[-length:], rhs[-length:]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}[node[1]](lhs, rhs)
+            if np.ndim(result):
+                result = np.where(np.isfinite(result), result, np.nan).astype(np.float32)
+        else:
+            _, name, args, kwargs = node
+            if name not in self.functions:
+                raise NotImplementedError(f"Unsupported operator: {name}")
+            window = int(self.eval_node(args[1], rows)) if name in self.TS_FUNCTIONS and len(args) > 1 else 1
+            values = [self.eval_node(arg, rows + window - 1) for arg in args]
+            result = self.functions[name](*values, **{k: self.eval_node(v, rows) for k, v in kwargs})
+            if np.ndim(result):
+                result = result[-rows:]
+
+        if np.ndim(result):
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def rank(self, x, rate=None):
+        return cs_rank(np.asarray(x, dtype=np.float32))
+
+    def ts_mean(self, x, d):
+        d      = int(d)
+        valid  = ~np.isnan(x)
+        total  = rolling_sum(np.where(valid, x, 0), d)
+        count  = rolling_sum(valid, d)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pad_front(np.where(count > 0, total / count, np.nan), len(x))
+
+    def ts_std(self, x, d):
+        d      = int(d)
+        valid  = ~np.isnan(x)
+        x0     = np.where(valid, x, 0).astype(np.float64)
+        count  = rolling_sum(valid, d)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = rolling_sum(x0, d) / count
+            var  = rolling_sum(x0 * x0, d) / count - mean * mean
+        return pad_front(np.sqrt(np.maximum(var, 0)), len(x))
+
+    def ts_av_diff(self, x, d):
+        return (x - self.ts_mean(x, d)).astype(np.float32)
+
+    def ts_zscore(self, x, d):
+        std = self.ts_std(x, d)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (x - self.ts_mean(x, d)) / std
+        return np.where(std > 1e-12, result, np.nan).astype(np.float32)
+
+    def ts_rank(self, x, d, constant=0):
+        # 当前值在过去 d 天中的排名，逐个滞后比较，避免构造 T x N x d 的窗口
+        d, x  = int(d), np.asarray(x, dtype=np.float32)
+        total = len(x)
+        if d < 2 or d > total:
+            return np.full(x.shape, np.nan, dtype=np.float32)
+        current = x[d - 1:]
+        below   = np.zeros(current.shape, dtype=np.float32)
+        for lag in range(1, d):
+            below += x[d - 1 - lag:total - lag] < current
+        result = below / (d - 1) + constant
+        result[np.isnan(current)] = np.nan
+        return pad_front(result, total)
+
+    def ts_decay_linear(self, x, d, dense=False):
+        # 权重 d, d-1, ..., 1；窗口较小时 (例如 settings 中的 decay) 直接在滑动窗口上加权求和，否则通过两次累加和 O(T x N) 计算
+        d      = int(d)
+        if d <= 16:
+            weights = np.arange(1, d + 1, dtype=np.float32)
+            windows = np.lib.stride_tricks.sliding_window_view(np.nan_to_num(np.asarray(x, dtype=np.float32)), d, axis=0)
+            return pad_front(windows @ (weights / weights.sum()), len(x))
+        x0     = np.nan_to_num(np.asarray(x, dtype=np.float64))
+        c1     = np.cumsum(np.concatenate([np.zeros((1, x0.shape[1])), x0]), axis=0)
+        c2     = np.cumsum(c1, axis=0)
+        window = c1[d:] - c1[:-d]
+        older  = c2[d:] - c2[:-d] - d * c1[:-d]
+        return pad_front(((d + 1) * window - older) / (d * (d + 1) / 2), len(x0))
+
+    def ts_decay_exp_window(self, x, d, factor=1.0):
+        # 权重 factor^k (k = 0..d-1)，在滑动窗口视图上与权重向量做一次矩阵乘法
+        d, factor = int(d), float(factor)
+        x0        = np.nan_to_num(np.asarray(x, dtype=np.float32))
+        weights   = (factor ** np.arange(d - 1, -1, -1)).astype(np.float32)
+        windows   = np.lib.stride_tricks.sliding_window_view(x0, d, axis=0)
+        return pad_front(windows @ (weights / weights.sum()), len(x0))
+
+    def group_stats(self, x, group):
+        valid = ~np.isnan(x)
+        x0    = np.where(valid, x, 0).astype(np.float64)
+        count = group.reduce(valid) if not valid.all() else np.broadcast_to(group.sizes, (len(x), group.count))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = group.reduce(x0) / count
+            var  = group.reduce(x0 * x0) / count - mean * mean
+        return group.expand(mean), group.expand(np.sqrt(np.maximum(var, 0)))
+
+    def group_neutralize(self, x, group):
+        mean, _ = self.group_stats(x, group)
+        return (x - mean).astype(np.float32)
+
+    def group_zscore(self, x, group):
+        mean, std = self.group_stats(x, group)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(std > 1e-12, (x - mean) / std, np.nan).astype(np.float32)
+
+    def group_rank(self, x, group):
+        # 每行先按值排序，再按分组编号稳定排序 (整数编号使用基数排序)，得到分组内从小到大的列顺序，排名即在分组内的位置
+        x     = np.asarray(x, dtype=np.float32)
+        mask  = np.isnan(x)
+        order = np.argsort(np.where(mask, np.inf, x), axis=1)
+        order = np.take_along_axis(order, np.argsort(group.codes[order], axis=1, kind='stable'), axis=1)
+        ranks = np.empty(x.shape, dtype=np.float32)
+        np.put_along_axis(ranks, order, np.broadcast_to(group.position, x.shape), axis=1)
+        count = group.expand(group.reduce((~mask).astype(np.float64)))
+        ranks /= np.maximum(count - 1, 1)
+        ranks[mask] = np.nan
+        return ranks
+
+class Prescreener:
+    """
+    在本地面板上快速筛掉明显无效的表达式，避免浪费远程模拟配额。
+    对每个表达式 (按 settings 中的 decay 和 neutralization 处理后) 在最近 eval_days 天上计算：
+    - coverage : 非 NaN 的比例，低于 min_coverage 时拒绝
+    - 常数信号  : 横截面没有差异的天数超过一半时拒绝
+    - turnover : 日均换手率 (权重绝对值之和归一化为 1)，不在 [min_turnover, max_turnover] 时拒绝
+    - 相关性    : 与已入队 / 本批已通过表达式的横截面排名相关系数超过 max_correlation 时拒绝
+    无法解析的表达式直接拒绝；使用了不支持的算子或面板中没有的字段的表达式无法评估，直接放行。
+    用到合成数据的表达式只检查是否为常数，不按覆盖率、换手率和相关性拒绝，也不作为相关性基准。
+
+    :param panel          : Panel
+    :param min_coverage   : 最低覆盖率
+    :param min_turnover   : 最低换手率
+    :param max_turnover   : 最高换手率
+    :param max_correlation: 与已有表达式的最大排名相关系数
+    :param eval_days      : 计算指标的天数 (之前的天数用于滚动窗口预热)
+    :param signature_days : 计算相关性时抽样的天数
+    :param max_references : 相关性基准的最大数量，超过时替换最早加入的基准 (内存约为 max_references x signature_days x 股票数 x 4 字节)
+    """
+    NEUTRALIZATIONS = {'MARKET': 'market', 'SECTOR': 'sector', 'INDUSTRY': 'industry', 'SUBINDUSTRY': 'subindustry'}
+
+    def __init__(self, panel, min_coverage: float = 0.3, min_turnover: float = 0.01, max_turnover: float = 0.7,
+                 max_correlation: float = 0.9, eval_days: int = 128, signature_days: int = 16, cache_size: int = 128,
+                 max_references: int = 2000):
+        self.panel           = panel
+        self.evaluator       = ExpressionEvaluator(panel, cache_size)
+        self.min_coverage    = min_coverage
+        self.min_turnover    = min_turnover
+        self.max_turnover    = max_turnover
+        self.max_correlation = max_correlation
+        self.eval_days       = eval_days
+        self.signature_days  = signature_days
+        self.max_references  = max_references
+        self.references      = None
+        self.reference_count = 0
+        self.reference_next  = 0
+
+    def is_synthetic(self, expression, settings=None):
+        names = node_names(parse_expression(expression))
+        names.add(self.NEUTRALIZATIONS.get(str((settings or {}).get('neutralization', '')).upper()))
+        return bool(names & self.panel.synthetic_names)
+
+    def signal(self, expression, settings=None):
+        settings = settings or {}
+        decay    = int(settings.get('decay', 0) or 0)
+        x        = self.evaluator.evaluate(expression, self.eval_days + max(decay, 1) - 1)
+        if decay > 1:
+            x = self.evaluator.ts_decay_linear(x, decay)
+        group = self.NEUTRALIZATIONS.get(str(settings.get('neutralization', '')).upper())
+        if group:
+            x = self.evaluator.group_neutralize(x, self.panel.group(group))
+        return np.asarray(x[-self.eval_days:], dtype=np.float32)
+
+    def metrics(self, x):
+        finite   = np.isfinite(x)
+        coverage = float(finite.mean())
+        x0       = np.where(finite, x, 0)
+        mean     = x0.sum(axis=1, keepdims=True) / np.maximum(finite.sum(axis=1, keepdims=True), 1)
+        weights  = np.where(finite, x0 - mean, 0)
+        gross   = np.abs(weights).sum(axis=1, keepdims=True)
+        active  = gross[:, 0] > 1e-9
+        weights = np.divide(weights, gross, out=np.zeros_like(weights), where=gross > 1e-9)
+        both    = active[1:] & active[:-1]
+        turnover = float(np.abs(np.diff(weights, axis=0)).sum(axis=1)[both].mean()) if both.any() else 0.0
+        return coverage, float(active.mean()), turnover
+
+    def signature(self, x):
+        rows = np.linspace(0, len(x) - 1, min(self.signature_days, len(x))).astype(int)
+        sig  = np.nan_to_num(cs_rank(x[rows]) - 0.5).ravel().astype(np.float32)
+        norm = np.linalg.norm(sig)
+        return sig / norm if norm > 0 else None
+
+    def add_signature(self, signature):
+        # 基准矩阵按需成倍扩容到 max_references 行，之后作为环形缓冲区覆盖最早加入的基准
+        if self.references is None or (self.reference_count == len(self.references) and self.reference_count < self.max_references):
+            size       = min(max(2 * self.reference_count, 256), self.max_references)
+            references = np.empty((size, len(signature)), dtype=np.float32)
+            if self.reference_count:
+                references[:self.reference_count] = self.references[:self.reference_count]
+            self.references = references
+        self.references[self.reference_next] = signature
+        self.reference_next  = (self.reference_next + 1) % self.max_references
+        self.reference_count = min(self.reference_count + 1, self.max_references)
+
+    def max_correlation_with(self, signature):
+        if not self.reference_count:
+            return 0.0
+        return float(np.abs(self.references[:self.reference_count] @ signature).max())
+
+    def add_reference(self, alphas):
+        """
+        加入已入队的 Alpha 作为相关性比较的基准，返回加入的数量。
+        最多保留 max_references 个基准，alphas 应按入队时间从早到晚排列。
+        """
+        added = 0
+        for alpha in alphas:
+            try:
+                signature = self.signature(self.signal(alpha['regular'], alpha.get('settings')))
+            except (SyntaxError, NotImplementedError, KeyError, ValueError):
+                continue
+            if self.is_synthetic(alpha['regular'], alpha.get('settings')):
+                continue
+            if signature is not None:
+                self.add_signature(signature)
+                added += 1
+        return added
+
+    def check(self, alpha):
+        """
+        返回拒绝原因，通过时返回 None。
+        """
+        try:
+            x = self.signal(alpha['regular'], alpha.get('settings'))
+        except SyntaxError:
+            return 'parse_error'
+        except (NotImplementedError, KeyError, ValueError):
+            return None
+        coverage, active, turnover = self.metrics(x)
+        if self.is_synthetic(alpha['regular'], alpha.get('settings')):
+            return 'constant' if active < 0.5 or self.signature(x) is None else None
+        if coverage < self.min_coverage:
+            return 'low_coverage'
+        if active < 0.5:
+            return 'constant'
+        if turnover > self.max_turnover:
+            return 'high_turnover'
+        if turnover < self.min_turnover:
+            return 'low_turnover'
+        signature = self.signature(x)
+        if signature is None:
+            return 'constant'
+        if self.max_correlation_with(signature) > self.max_correlation:
+            return 'correlated'
+        self.add_signature(signature)
+        return None
+
+    def screen(self, alphas):
+        """
+        返回 (通过的 Alpha 列表, {拒绝原因: 数量})。
+        """
+        accepted, rejected = [], Counter()
+        for alpha in alphas:
+            reason = self.check(alpha)
+            if reason:
+                rejected[reason] += 1
+            else:
+                accepted.append(alpha)
+        return accepted, dict(rejected)
+
+def prescreen_alphas(alphas, prescreener, batch_size: int = 1000):
+    """
+    生成器：按批次筛选 Alpha，只产出通过筛选的 Alpha，并记录每批的拒绝原因。
+    """
+    batch, total = [], Counter()
+
+    def flush(batch):
+        accepted, rejected = prescreener.screen(batch)
+        total.update(rejected)
+        logging.info(f"Prescreened {len(batch)} alphas: {len(accepted)} accepted, rejected {rejected}. Total rejected {dict(total)}")
+        return accepted
+
+    for alpha in alphas:
+        batch.append(alpha)
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
@@ -0,0 +1,267 @@
+import ast
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+PENDING = 'PENDING'
+LEASED  = 'LEASED'
+DONE    = 'DONE'
+FAILED  = 'FAILED'
+DUPLICATE = 'DUPLICATE'
+SUBMITTED = 'SUBMITTED'
+
+class AlphaQueue:
+    """
+    基于 SQLite 的持久化待模拟 Alpha 队列。
+    出队只读取并标记一个批次 (O(batch))，不再重写整个 CSV 文件。
+    状态流转：PENDING -> LEASED (已出队) -> SUBMITTED (已提交，记录 location) -> DONE (结果已写入)。
+    每次状态变化都在 synchronous=FULL 的事务中提交 (fsync)，相当于一个预写日志：
+    进程崩溃后 LEASED 的 Alpha 会重新回到队列，SUBMITTED 的 location 可以重新接上继续轮询。
+
+    :param db_path: SQLite 数据库文件路径
+    """
+    def __init__(self, db_path: str = 'alphas_queue.db'):
+        self.db_path = db_path
+        self.lock    = threading.Lock()
+        self.conn    = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS alphas (
+                id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                type      TEXT NOT NULL,
+                settings  TEXT NOT NULL,
+                regular   TEXT NOT NULL,
+                status    TEXT NOT NULL DEFAULT 'PENDING',
+                leased_at REAL
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(alphas)")]
+        if 'location' not in columns:
+            self.conn.execute("ALTER TABLE alphas ADD COLUMN location TEXT")
+        if 'owner' not in columns:
+            self.conn.execute("ALTER TABLE alphas ADD COLUMN owner TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_alphas_status ON alphas (status, id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_alphas_location ON alphas (location)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def put_many(self, alphas, import_offset=None):
+        """
+        批量入队，alphas 为 {'type','settings','regular'} 字典的可迭代对象。
+        import_offset 为 (CSV 文件, 读取位置)，与这批 Alpha 在同一个事务中记录。
+        返回入队数量。
+        """
+        rows = []
+        for alpha in alphas:
+            settings = alpha['settings']
+            if isinstance(settings, str):
+                settings = ast.literal_eval(settings)
+            rows.append((alpha.get('type', 'REGULAR'), json.dumps(settings), alpha['regular']))
+        if not rows and import_offset is None:
+            return 0
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("INSERT INTO alphas (type, settings, regular) VALUES (?, ?, ?)", rows)
+                if import_offset is not None:
+                    self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (self.offset_key(import_offset[0]), str(import_offset[1])))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    @staticmethod
+    def offset_key(csv_file: str):
+        return f"import_offset:{os.path.abspath(csv_file)}"
+
+    def import_offset(self, csv_file: str):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (self.offset_key(csv_file),)).fetchone()
+        return int(row[0]) if row else 0
+
+    def clear_import_offset(self, csv_file: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM meta WHERE key = ?", (self.offset_key(csv_file),))
+
+    def import_csv(self, csv_file: str, chunk_size: int = 10000):
+        """
+        导入旧格式的 alphas_pending_simulated.csv (type,settings,regular)。
+        每批 Alpha 与已读取到的文件位置在同一个事务中提交，导入中途崩溃后从该位置继续，不会重复入队。
+        导入成功后将 CSV 截断为只剩表头并清除记录的位置，避免重复导入；
+        截断后、清除位置前崩溃时，记录的位置超过文件大小，下次从头导入。
+        返回导入数量。
+        """
+        try:
+            file = open(csv_file, 'r', newline='')
+        except FileNotFoundError:
+            return 0
+
+        def lines():
+            # 逐行读取 (不使用文件迭代器)，每读完一行 Alpha 后 file.tell() 即为下一行的位置
+            while True:
+                line = file.readline()
+                if not line:
+                    return
+                yield line
+
+        total  = 0
+        offset = self.import_offset(csv_file)
+        with file:
+            reader     = csv.DictReader(lines())
+            fieldnames = reader.fieldnames or ['type', 'settings', 'regular']
+            if offset and offset <= os.fstat(file.fileno()).st_size:
+                logging.info(f"Resuming import of {csv_file} from byte {offset}.")
+                file.seek(offset)
+            chunk = []
+            for row in reader:
+                try:
+                    row['settings'] = ast.literal_eval(row['settings'])
+                except (ValueError, SyntaxError):
+                    logging.error(f"Error evaluating settings: {row['settings']}")
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    total += self.put_many(chunk, import_offset=(csv_file, file.tell()))
+                    chunk = []
+            total += self.put_many(chunk, import_offset=(csv_file, file.tell()))
+
+        if total:
+            with open(csv_file, 'w', newline='') as file:
+                csv.DictWriter(file, fieldnames=fieldnames).writeheader()
+            logging.info(f"Imported {total} alphas from {csv_file} into {self.db_path}.")
+        self.clear_import_offset(csv_file)
+        return total
+
+    def dequeue(self, n: int):
+        """
+        取出最多 n 个 PENDING Alpha 并标记为 LEASED。
+        返回 [(queue_id, alpha_dict), ...]。
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT id, type, settings, regular FROM alphas WHERE status = ? ORDER BY id LIMIT ?",
+                    (PENDING, n)).fetchall()
+                self.conn.executemany("UPDATE alphas SET status = ?, leased_at = ? WHERE id = ?",
+                                      [(LEASED, time.time(), row[0]) for row in rows])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [(qid, {'type': type_, 'settings': json.loads(settings), 'regular': regular})
+                for qid, type_, settings, regular in rows]
+
+    def _set_status(self, qids, status):
+        qids = list(qids)
+        if not qids:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("UPDATE alphas SET status = ? WHERE id = ?", [(status, qid) for qid in qids])
+            self.conn.execute("COMMIT")
+
+    def ack(self, qids):
+        self._set_status(qids, DONE)
+
+    def mark_submitted(self, qids, location: str, owner: str = None):
+        # owner 为提交该模拟的账号，多账号时只有该账号能继续轮询这个 location
+        qids = list(qids)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("UPDATE alphas SET status = ?, location = ?, owner = ? WHERE id = ?",
+                                  [(SUBMITTED, location, owner, qid) for qid in qids])
+            self.conn.execute("COMMIT")
+
+    def ack_location(self, location: str):
+        # 该 location 的结果已写入，对应的 Alpha 全部标记为 DONE
+        with self.lock:
+            self.conn.execute("UPDATE alphas SET status = ? WHERE location = ? AND status = ?", (DONE, location, SUBMITTED))
+
+    def in_flight_locations(self, owner: str = None):
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT location FROM alphas WHERE status = ? AND owner IS ? ORDER BY id",
+                                     (SUBMITTED, owner)).fetchall()
+        return [row[0] for row in rows]
+
+    def orphans(self, owners):
+        """
+        返回 owner 不在 owners 中的 SUBMITTED Alpha：[(queue_id, owner, location, alpha_dict), ...]。
+        只有提交模拟的账号能轮询它的 location，本次运行没有该账号时这些模拟无法再接上，只能重新模拟。
+        """
+        owners = list(owners)
+        known  = [owner for owner in owners if owner is not None]
+        clause = f"owner NOT IN ({','.join('?' * len(known))})" if known else "1"
+        clause = f"(owner IS NULL OR {clause})" if None not in owners else f"owner IS NOT NULL AND {clause}"
+        with self.lock:
+            rows = self.conn.execute(f"SELECT id, owner, location, type, settings, regular FROM alphas WHERE status = ? AND {clause} ORDER BY id",
+                                     (SUBMITTED, *known)).fetchall()
+        return [(qid, owner, location, {'type': type_, 'settings': json.loads(settings), 'regular': regular})
+                for qid, owner, location, type_, settings, regular in rows]
+
+    def release_orphans(self, qids):
+        # 把无法接上的 SUBMITTED Alpha 放回队列，并清除 location 和 owner
+        qids = list(qids)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("UPDATE alphas SET status = ?, location = NULL, owner = NULL WHERE id = ? AND status = ?",
+                                  [(PENDING, qid, SUBMITTED) for qid in qids])
+            self.conn.execute("COMMIT")
+
+    def fail(self, qids):
+        self._set_status(qids, FAILED)
+
+    def mark_duplicate(self, qids):
+        self._set_status(qids, DUPLICATE)
+
+    def requeue(self, qids):
+        self._set_status(qids, PENDING)
+
+    def recover(self):
+        """
+        启动时调用：把上次运行遗留的 LEASED Alpha 放回队列，返回数量。
+        """
+        with self.lock:
+            cursor = self.conn.execute("UPDATE alphas SET status = ? WHERE status = ?", (PENDING, LEASED))
+        if cursor.rowcount:
+            logging.info(f"Requeued {cursor.rowcount} unacknowledged alphas from previous run.")
+        return cursor.rowcount
+
+    def counts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM alphas GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, SUBMITTED: 0, DONE: 0, FAILED: 0, DUPLICATE: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def pending_alphas(self, limit: int = 10000):
+        """
+        只读地返回最近入队的最多 limit 个 PENDING Alpha (不改变状态)，用于本地预筛选的相关性基准。
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT type, settings, regular FROM alphas WHERE status = ? ORDER BY id DESC LIMIT ?",
+                                     (PENDING, limit)).fetchall()
+        return [{'type': type_, 'settings': json.loads(settings), 'regular': regular} for type_, settings, regular in rows]
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, default='alphas_queue.db')
+    parser.add_argument("--import-csv", type=str, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    queue = AlphaQueue(args.db)
+    if args.import_csv:
+        queue.import_csv(args.import_csv)
+    print(queue.counts())
@@ -1,149 +1,371 @@
+import argparse
 import logging
 import time
 import csv
-import requests
 import os
-import ast
 import signal
+import threading
 from datetime import datetime
 from pytz import timezone
-from auth_utils import global_sign_in, setup_logging
+from auth_utils import API_BASE, get_client, parse_retry_after, setup_logging
+from alpha_queue import AlphaQueue
+from poll_scheduler import PollScheduler
+from alpha_dedupe import FingerprintIndex, SIMULATED
+from result_store import ResultStore
+from simulation_metrics import SimulationMetrics
+from concurrency_controller import ConcurrencyController
+
+# 同一进程内多个 Simulator (多账号) 共用 alphas_simulated.csv 时串行写入
+RESULTS_LOCK = threading.Lock()
+# BRAIN 的 multi-simulation 每次最多包含 10 个 Alpha
+MAX_MULTI_SIZE = 10
+# 提交模拟时直接返回给调用方的 4xx：401 仍由 BrainClient 重新登录后重试，408 (请求超时) 与网络错误一样放回队列
+CLIENT_ERRORS = tuple(code for code in range(400, 500) if code not in (401, 408))
 
 class AlphaSimulator:
-    def __init__(self, max_concurrent: int, alpha_list_file: str):
-        self.max_concurrent = max_concurrent
+    def __init__(self, max_concurrent: int, alpha_list_file: str, queue_db: str = 'alphas_queue.db', multi_size: int = 1,
+                 fingerprint_db: str = 'alpha_fingerprints.db', result_db: str = 'alpha_results.db', client=None,
+                 owner: str = None, fingerprints=None, result_store=None, stats_file: str = None, metrics_port: int = None,
+                 max_limit: int = None):
+        # max_concurrent 为初始并发窗口，由 ConcurrencyController 在 [1, max_limit] 内按 AIMD 调整
+        self.concurrency = ConcurrencyController(max_concurrent, max_limit=max_limit or max_concurrent * 2)
+        self.max_concurrent = self.concurrency.window
+        self.owner = owner
+        self.multi_size = min(max(multi_size, 1), MAX_MULTI_SIZE)
         self.alpha_list_file = alpha_list_file
         self.alphas_simulated = 'alphas_simulated.csv'
+        self.queue = AlphaQueue(queue_db)
+        self.queue.import_csv(alpha_list_file)
+        self.fingerprints = fingerprints or FingerprintIndex(fingerprint_db)
+        self.result_store = result_store or ResultStore(result_db)
+        self.results_file = None
+        self.results_writer = None
         self.active_simulations = []
-        self.session = global_sign_in()
+        self.scheduler = PollScheduler()
+        self.client = client or get_client(pool_size=self.concurrency.max_limit * 2 + 4)
         self.sim_queue_ls = []
-        self.batch_num_per_queue = max_concurrent * 2
+        self.batch_num_per_queue = self.max_concurrent * self.multi_size * 2
+        self.submit_paused_until = 0
         self.terminate = False
+        self.finish_active = True
+        self.drained = False
+        self.metrics = SimulationMetrics(self, stats_file=stats_file, port=metrics_port)
+        # 请求重试和退避可能持续数分钟，期间也更新心跳，避免被 monitor_simulation.sh 误判为挂起
+        self.client.heartbeats.append(self.metrics.beat)
+        if stats_file or metrics_port is not None:
+            self.metrics.start()
+        self.recover_simulations()
         signal.signal(signal.SIGINT, self.handle_exit)
+        signal.signal(signal.SIGTERM, self.handle_exit)
+
+    def active_owners(self):
+        # 本次运行中能继续轮询 location 的账号
+        return [self.owner]
+
+    def recover_simulations(self):
+        # 上次运行已出队未提交的 Alpha 放回队列；已提交的模拟重新接上继续轮询
+        # 由本次运行中没有的账号提交的模拟无法轮询，放回队列重新模拟
+        # 先把这些 Alpha 的指纹回退为 QUEUED，否则重新出队时会被当作已模拟而标记为 DUPLICATE
+        self.queue.recover()
+        orphans = self.queue.orphans(self.active_owners())
+        if orphans:
+            self.fingerprints.requeue_many((alpha['regular'], alpha['settings']) for _, _, _, alpha in orphans)
+            self.queue.release_orphans(qid for qid, _, _, _ in orphans)
+            for owner in dict.fromkeys(owner for _, owner, _, _ in orphans):
+                locations = {location for _, other, location, _ in orphans if other == owner}
+                count     = sum(1 for _, other, _, _ in orphans if other == owner)
+                logging.warning(f"Requeued {count} alphas from {len(locations)} in-flight simulations of inactive owner {owner}.")
+        for location_url in self.queue.in_flight_locations(self.owner):
+            self.active_simulations.append(location_url)
+            self.scheduler.schedule(location_url, 0)
+        if self.active_simulations:
+            logging.info(f"Re-attached to {len(self.active_simulations)} in-flight simulations from previous run.")
 
     def handle_exit(self, signum, frame):
-        logging.info("Received SIGINT. Finishing active simulations before exiting...")
-        self.terminate = True
-        self.finish_active_simulations()
-        logging.info("All active simulations processed. Exiting safely.")
-        exit(0)
+        # 信号处理函数只设置退出标志，队列和 HTTP 操作由主循环退出后的 drain 完成
+        # SIGTERM (monitor_simulation.sh 重启) 不等待进行中的模拟，它们已记录在队列中，下次启动时重新接上
+        self.terminate     = True
+        self.finish_active = self.finish_active and signum != signal.SIGTERM
+        if self.finish_active:
+            logging.info(f"Received {signal.Signals(signum).name}. Finishing active simulations before exiting...")
+        else:
+            logging.info(f"Received {signal.Signals(signum).name}. Exiting, active simulations will be resumed on restart...")
+
+    def drain(self):
+        if self.drained:
+            return
+        self.drained = True
+        self.release_queued_alphas()
+        if self.finish_active:
+            self.finish_active_simulations()
+        self.close_results()
+        if self.finish_active:
+            logging.info("All active simulations processed. Exiting safely.")
+        else:
+            logging.info(f"Left {len(self.active_simulations)} active simulations in the queue for the next run. Exiting safely.")
 
     def read_alphas_from_csv_in_batches(self):
-        alphas = []
-        temp_file_name = self.alpha_list_file + '.tmp'
-
-        with open(self.alpha_list_file, 'r') as file, open(temp_file_name, 'w', newline='') as temp_file:
-            reader = csv.DictReader(file)
-            fieldnames = reader.fieldnames
-            writer = csv.DictWriter(temp_file, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for _ in range(self.batch_num_per_queue):
-                row = next(reader, None)
-                if not row:
-                    break
-
-                if 'settings' in row:
-                    try:
-                        row['settings'] = ast.literal_eval(row['settings']) if isinstance(row['settings'], str) else row['settings']
-                    except (ValueError, SyntaxError):
-                        logging.error(f"Error evaluating settings: {row['settings']}")
-                        continue
-                alphas.append(row)
-
-            writer.writerows(reader)
-
-        os.replace(temp_file_name, self.alpha_list_file)
-        return alphas
-
-    def simulate_alpha(self, alpha):
-        for attempt in range(36):
-            try:
-                response = self.session.post('https://api.worldquantbrain.com/simulations', json=alpha)
-                response.raise_for_status()
-                if "Location" in response.headers:
-                    logging.info(f"Alpha location retrieved successfully: {response.headers['Location']}")
-                    return response.headers['Location']
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Simulation request error: {e}. Retrying in 5s...")
-                time.sleep(5)
-
-        logging.error("Simulation request failed after multiple attempts, re-logging in.")
-        self.session = global_sign_in()
-        return None
+        # 跳过已经模拟过的 表达式 + settings 组合
+        while True:
+            batch = self.queue.dequeue(self.batch_num_per_queue)
+            duplicates = [qid for qid, alpha in batch if self.fingerprints.is_simulated(alpha['regular'], alpha['settings'])]
+            if duplicates:
+                logging.info(f"Skipped {len(duplicates)} already simulated alphas.")
+                self.queue.mark_duplicate(duplicates)
+                duplicates = set(duplicates)
+                batch = [item for item in batch if item[0] not in duplicates]
+            if batch or not duplicates:
+                return batch
 
-    def load_new_alpha_and_simulate(self):
+    def release_queued_alphas(self):
+        # 已出队但尚未提交的 Alpha 放回队列
+        if self.sim_queue_ls:
+            self.queue.requeue([qid for qid, _ in self.sim_queue_ls])
+            self.sim_queue_ls = []
+
+    def next_simulation_batch(self):
+        """
+        从本地缓存中取出下一次提交的 Alpha。
+        multi_size > 1 时，把 settings 相同的 Alpha 合并为一个 multi-simulation (最多 multi_size 个)。
+        返回 [(queue_id, alpha), ...]，队列为空时返回空列表。
+        """
         if not self.sim_queue_ls:
             self.sim_queue_ls = self.read_alphas_from_csv_in_batches()
+        if not self.sim_queue_ls:
+            return []
 
-        if len(self.active_simulations) >= self.max_concurrent:
-            logging.info(f"Max concurrent simulations reached ({self.max_concurrent}). Waiting 2s...")
-            time.sleep(2)
-            return
+        batch = [self.sim_queue_ls.pop(0)]
+        settings = batch[0][1]['settings']
+        remaining = []
+        for item in self.sim_queue_ls:
+            if len(batch) < self.multi_size and item[1]['settings'] == settings:
+                batch.append(item)
+            else:
+                remaining.append(item)
+        self.sim_queue_ls = remaining
+        return batch
 
-        if self.sim_queue_ls:
-            alpha = self.sim_queue_ls.pop(0)
+    def simulate_batch(self, batch):
+        # 单个 Alpha 按原格式提交，多个 Alpha 以列表形式提交为 multi-simulation
+        for _, alpha in batch:
             logging.info(f"Simulating alpha: {alpha['regular']} with settings: {alpha['settings']}")
-            location_url = self.simulate_alpha(alpha)
+        qids = [qid for qid, _ in batch]
+        payload = batch[0][1] if len(batch) == 1 else [alpha for _, alpha in batch]
+        location_url, error = self.submit_simulation(payload)
+        if location_url:
+            # 先持久化 location，崩溃重启后可以继续轮询
+            self.queue.mark_submitted(qids, location_url, self.owner)
+            self.fingerprints.add_alphas([alpha for _, alpha in batch], SIMULATED)
+            self.concurrency.on_success(len(self.active_simulations) + 1)
+        elif error == 'throttled':
+            # 被限流的 Alpha 放回队列，稍后重新提交
+            self.queue.requeue(qids)
+            self.concurrency.on_throttle()
+        elif error == 'unavailable':
+            # 网络错误或 5xx 用完了重试次数，Alpha 本身没有问题，放回队列稍后重新提交
+            self.queue.requeue(qids)
+        else:
+            # 服务端拒绝了这个 Alpha (4xx)，重新提交也不会成功
+            self.queue.fail(qids)
+        self.apply_concurrency()
+        return location_url
+
+    def apply_concurrency(self):
+        # 并发上限和每次出队数量跟随当前窗口
+        self.max_concurrent = self.concurrency.window
+        self.batch_num_per_queue = self.max_concurrent * self.multi_size * 2
+
+    def submit_simulation(self, alpha):
+        """
+        提交模拟，返回 (location, error)，成功时 error 为 None。
+        - throttled  : 429 (请求过多或并发模拟数超限)，不在 BrainClient 中重试，而是暂停提交并交给并发控制器减小窗口
+        - rejected   : 其他 4xx，服务端拒绝了这个 Alpha
+        - unavailable: 网络错误或 5xx 在 BrainClient 中用完了重试次数，暂停提交一个最大退避间隔
+        重试、退避和重新登录 (401) 由 BrainClient 处理。
+        """
+        start = time.monotonic()
+        response = self.client.post(f"{API_BASE}/simulations", json=alpha, return_statuses=CLIENT_ERRORS)
+        ok = response is not None and response.status_code < 400 and "Location" in response.headers
+        self.metrics.record_submit(time.monotonic() - start, ok, len(alpha) if isinstance(alpha, list) else 1)
+        if ok:
+            logging.info(f"Alpha location retrieved successfully: {response.headers['Location']}")
+            return response.headers['Location'], None
+        if response is not None and response.status_code == 429:
+            pause = max(parse_retry_after(response.headers.get("Retry-After")), self.scheduler.default_delay)
+            self.submit_paused_until = time.monotonic() + pause
+            logging.warning(f"Simulation submit throttled ({response.text[:100]}). Pausing submits for {pause:.1f}s.")
+            return None, 'throttled'
+        if response is not None and response.status_code >= 400:
+            logging.error(f"Simulation request rejected with {response.status_code}: {response.text[:200]}")
+            return None, 'rejected'
+        pause = self.client.backoff_max
+        self.submit_paused_until = time.monotonic() + pause
+        logging.error(f"Simulation request failed after multiple attempts. Pausing submits for {pause:.1f}s.")
+        return None, 'unavailable'
+
+    def load_new_alpha_and_simulate(self):
+        # 补满所有空闲的并发名额；提交被限流时暂停补充
+        while len(self.active_simulations) < self.max_concurrent:
+            if time.monotonic() < self.submit_paused_until:
+                logging.info(f"Simulation submits paused, {len(self.active_simulations)}/{self.max_concurrent} slots in use.")
+                break
+            batch = self.next_simulation_batch()
+            if not batch:
+                logging.info("No more alphas available in the queue.")
+                break
+
+            location_url = self.simulate_batch(batch)
             if location_url:
                 self.active_simulations.append(location_url)
+                self.scheduler.schedule(location_url)
         else:
-            logging.info("No more alphas available in the queue.")
+            logging.info(f"Max concurrent simulations reached ({self.max_concurrent}).")
+        self.scheduler.observe_slots(len(self.active_simulations), self.max_concurrent)
+
+    def poll_simulation(self, url):
+        """
+        查询一次模拟进度。
+        返回 (retry_after, results)：模拟完成时 retry_after 为 0、results 为 Alpha 详情列表
+        (multi-simulation 的每个 child 各一个)；未完成时 results 为 None，
+        retry_after 为服务端建议的下次轮询间隔 (请求失败时为 None)。
+        """
+        start = time.monotonic()
+        response = self.client.get(url, max_retries=2)
+        self.metrics.record_poll(time.monotonic() - start, response is not None)
+        if response is None:
+            logging.error(f"Error fetching simulation progress: {url}")
+            return None, None
+        # Retry-After 可能是 HTTP 日期，无法解析时按默认间隔继续轮询
+        header      = response.headers.get("Retry-After")
+        retry_after = parse_retry_after(header, self.scheduler.default_delay) if header else 0
+        if retry_after > 0:
+            return retry_after, None
 
-    def check_simulation_progress(self, url):
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
-            if response.headers.get("Retry-After", 0) == 0:
-                alpha_id = response.json().get("alpha")
-                return self.session.get(f"https://api.worldquantbrain.com/alphas/{alpha_id}").json() if alpha_id else response.json()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching simulation progress: {e}")
-            self.session = global_sign_in()
-        return None
+            progress = response.json()
+        except ValueError:
+            logging.error(f"Invalid simulation progress response: {url}")
+            return None, None
+        child_ids = progress.get("children")
+        results   = [self.fetch_child_result(child_id) for child_id in child_ids] if child_ids else [self.fetch_alpha_result(progress)]
+        if any(result is None for result in results):
+            return None, None
+        return 0, results
+
+    def fetch_alpha_result(self, progress):
+        alpha_id = progress.get("alpha")
+        return self.client.request_json("GET", f"{API_BASE}/alphas/{alpha_id}") if alpha_id else progress
+
+    def fetch_child_result(self, child_id):
+        progress = self.client.request_json("GET", f"{API_BASE}/simulations/{child_id}")
+        return self.fetch_alpha_result(progress) if progress is not None else None
+
+    def write_results(self, results):
+        if not results:
+            return
+        with RESULTS_LOCK:
+            self.write_results_locked(results)
+        self.metrics.record_completed(len(results))
+
+    def write_results_locked(self, results):
+        if self.results_writer is None:
+            # 结果文件只打开一次，每批结果写入后 flush
+            self.results_file = open(self.alphas_simulated, 'a+', newline='')
+            self.results_file.seek(0, os.SEEK_END)
+            is_empty = self.results_file.tell() == 0
+            self.results_writer = csv.DictWriter(self.results_file, fieldnames=["id", "regular", "status"])
+            if is_empty:
+                self.results_writer.writeheader()
+        for result in results:
+            logging.info(f"Alpha id: {result.get('id')} finished with status: {result.get('status')}")
+            self.results_writer.writerow({"id": result.get("id"), "regular": result.get("regular"), "status": result.get("status")})
+            self.result_store.add(result)
+        self.results_file.flush()
+        # 调用方写入后立即 ack_location，结果必须先提交到结果库，否则崩溃时会丢失已确认模拟的 IS 指标
+        self.result_store.flush()
+
+    def close_results(self):
+        self.result_store.flush()
+        self.client.log_stats()
+        self.metrics.stop()
+        if self.results_file:
+            self.results_file.close()
+            self.results_file, self.results_writer = None, None
 
     def check_simulation_status(self):
         if not self.active_simulations:
             logging.info("No active simulations.")
             return
 
-        pending_simulations = []
-
-        with open(self.alphas_simulated, 'a+', newline='') as file:
-            file.seek(0, os.SEEK_END)
-            is_empty = file.tell() == 0
-            writer = csv.DictWriter(file, fieldnames=["id", "regular", "status"])
-            if is_empty:
-                writer.writeheader()
+        finished_results = []
+        finished_urls = []
+        for sim_url in self.scheduler.pop_due():
+            retry_after, results = self.poll_simulation(sim_url)
+            self.scheduler.record_poll(finished=results is not None)
+            if results is not None:
+                finished_results.extend(results)
+                finished_urls.append(sim_url)
+                self.active_simulations.remove(sim_url)
+            else:
+                self.scheduler.schedule(sim_url, retry_after)
 
-            for sim_url in self.active_simulations:
-                result = self.check_simulation_progress(sim_url)
-                if result:
-                    logging.info(f"Alpha id: {result.get('id')} finished with status: {result.get('status')}")
-                    writer.writerow({"id": result.get("id"), "regular": result.get("regular"), "status": result.get("status")})
-                else:
-                    pending_simulations.append(sim_url)
+        # 结果提交到结果库后再确认，崩溃时最多重复写入，不会丢失
+        self.write_results(finished_results)
+        for sim_url in finished_urls:
+            self.queue.ack_location(sim_url)
+        self.scheduler.observe_slots(len(self.active_simulations), self.max_concurrent)
+        if finished_results:
+            logging.info(f"{len(self.active_simulations)} simulations still in progress. Poll stats: {self.scheduler.stats()}")
 
-        self.active_simulations = pending_simulations
-        logging.info(f"{len(self.active_simulations)} simulations still in progress.")
+    def wait_for_next_poll(self, draining: bool = False):
+        # 睡眠到最早到期的轮询；仍有空闲名额 (队列为空) 时最多等待默认间隔再尝试补充，退出前 (draining) 不再补充
+        # 按秒分段睡眠，收到退出信号后主循环能及时进入 drain
+        delay = self.scheduler.time_until_next()
+        if delay is None or (not draining and len(self.active_simulations) < self.max_concurrent):
+            delay = min(delay if delay is not None else self.scheduler.default_delay, self.scheduler.default_delay)
+        deadline = time.monotonic() + delay
+        while draining or not self.terminate:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 1))
 
     def manage_simulations(self):
         try:
             while not self.terminate:
+                self.metrics.beat()
                 self.check_simulation_status()
                 self.load_new_alpha_and_simulate()
-                time.sleep(3)
+                self.wait_for_next_poll()
         except KeyboardInterrupt:
-            self.handle_exit(signal.SIGINT, None)
+            self.terminate = True
+        self.drain()
 
     def finish_active_simulations(self):
         while self.active_simulations:
-            self.check_simulation_status()
             logging.info(f"Waiting for {len(self.active_simulations)} active simulations to complete...")
-            time.sleep(3)
+            self.wait_for_next_poll(draining=True)
+            self.metrics.beat()
+            self.check_simulation_status()
 
 if __name__ == "__main__":
-    setup_logging(log_file='simulation.log', log_to_file=True, log_to_console=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync")
+    parser.add_argument("--max-concurrent", type=int, default=10, help="initial concurrency window")
+    parser.add_argument("--max-limit", type=int, default=None, help="upper bound of the adaptive concurrency window (default: 2 * max-concurrent)")
+    parser.add_argument("--multi-size", type=int, default=1, choices=range(1, MAX_MULTI_SIZE + 1), metavar="1-10",
+                        help="number of alphas per multi-simulation (1 disables batching)")
+    parser.add_argument("--stats-file", type=str, default='simulation_stats.json', help="metrics file read by monitor_simulation.sh")
+    parser.add_argument("--metrics-port", type=int, default=None, help="also serve the metrics on http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args()
+
+    setup_logging(log_file='simulation.log', log_to_file=True, log_to_console=False, mode='a')
     logging.info(f"Current time in Eastern: {datetime.now(timezone('US/Eastern')).strftime('%Y-%m-%d %H:%M:%S')}")
-    simulator = AlphaSimulator(max_concurrent=10, alpha_list_file='alphas_pending_simulated.csv')
+    if args.engine == "async":
+        from async_simulator import AsyncAlphaSimulator
+        simulator = AsyncAlphaSimulator(max_concurrent=args.max_concurrent, alpha_list_file='alphas_pending_simulated.csv', multi_size=args.multi_size,
+                                        stats_file=args.stats_file, metrics_port=args.metrics_port, max_limit=args.max_limit)
+    else:
+        simulator = AlphaSimulator(max_concurrent=args.max_concurrent, alpha_list_file='alphas_pending_simulated.csv', multi_size=args.multi_size,
+                                   stats_file=args.stats_file, metrics_port=args.metrics_port, max_limit=args.max_limit)
     simulator.manage_simulations()
@@ -1,12 +1,12 @@
 import argparse
-from auth_utils import global_sign_in, setup_logging, retry_request
+from auth_utils import API_BASE, get_client, setup_logging
 
 parser = argparse.ArgumentParser()
 parser.add_argument("alpha_id", type=str)
 
 args = parser.parse_args()
 setup_logging(log_to_file=False)
-SESS = global_sign_in()
-url = f"https://api.worldquantbrain.com/alphas/{args.alpha_id}"
-result = retry_request(SESS.get, f"{url}")
+CLIENT = get_client()
+url = f"{API_BASE}/alphas/{args.alpha_id}"
+result = CLIENT.request_json("GET", url)
 print(result)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from alpha_simulator import AlphaSimulator
+
+class AsyncAlphaSimulator(AlphaSimulator):
+    """
+    基于 asyncio 的模拟引擎。
+    每个 Alpha 作为独立任务完成 提交 -> 轮询进度 -> 获取 Alpha 详情，
+    所有请求通过共享的 BrainClient 在同一个连接池上并发执行，空出的并发名额立即补充新的 Alpha。
+    结果文件与 SIGINT / SIGTERM 退出逻辑与 AlphaSimulator 相同 (SIGINT 等待进行中的模拟完成，SIGTERM 立即退出)。
+    """
+    def __init__(self, max_concurrent: int, alpha_list_file: str, queue_db: str = 'alphas_queue.db', multi_size: int = 1, poll_interval: float = 3, **kwargs):
+        super().__init__(max_concurrent, alpha_list_file, queue_db, multi_size, **kwargs)
+        self.poll_interval = poll_interval
+        self.scheduler.default_delay = poll_interval
+        self.executor      = ThreadPoolExecutor(max_workers=self.concurrency.max_limit * 2 + 4)
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def run_simulation(self, batch):
+        location_url = await self.call(self.simulate_batch, batch)
+        if location_url:
+            self.active_simulations.append(location_url)
+            await self.follow_simulation(location_url)
+
+    async def resume_simulation(self, location_url):
+        await self.follow_simulation(location_url, retry_after=0)
+
+    async def follow_simulation(self, location_url, retry_after=None):
+        # 每个任务按 Retry-After 睡眠到下次到期时间，由事件循环的定时器堆统一调度
+        self.scheduler.observe_slots(len(self.active_simulations), self.max_concurrent)
+        while True:
+            await asyncio.sleep(self.scheduler.clamp(retry_after))
+            retry_after, results = await self.call(self.poll_simulation, location_url)
+            self.scheduler.record_poll(finished=results is not None)
+            if results is not None:
+                self.write_results(results)
+                self.queue.ack_location(location_url)
+                break
+        self.active_simulations.remove(location_url)
+        self.scheduler.observe_slots(len(self.active_simulations), self.max_concurrent)
+        logging.info(f"{len(self.active_simulations)} simulations still in progress. Poll stats: {self.scheduler.stats()}")
+
+    async def heartbeat(self):
+        # 事件循环仍在调度任务即视为存活，主循环可能长时间等待空闲名额
+        while True:
+            self.metrics.beat()
+            await asyncio.sleep(1)
+
+    async def wait_for_slot(self, tasks):
+        """
+        等待一个并发名额，名额数为并发控制器的当前窗口 (随时可能变化)。
+        窗口已满时等待任意一个模拟完成，提交被限流时等待暂停结束。收到退出信号时返回 False。
+        """
+        while not self.terminate:
+            pause = self.submit_paused_until - time.monotonic()
+            if len(tasks) < self.max_concurrent and pause <= 0:
+                return True
+            timeout = pause if pause > 0 else self.poll_interval
+            if tasks:
+                await asyncio.wait(set(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(timeout)
+        return False
+
+    async def run(self):
+        tasks = set()
+        heartbeat = asyncio.create_task(self.heartbeat())
+        for location_url in list(self.active_simulations):
+            task = asyncio.create_task(self.resume_simulation(location_url))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        while await self.wait_for_slot(tasks):
+            batch = await self.call(self.next_simulation_batch)
+            if not batch:
+                logging.info("No more alphas available in the queue.")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            task = asyncio.create_task(self.run_simulation(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        self.release_queued_alphas()
+        if tasks and self.finish_active:
+            logging.info(f"Waiting for {len(tasks)} active simulations to complete...")
+            await asyncio.gather(*tasks, return_exceptions=True)
+        elif tasks:
+            # SIGTERM：进行中的模拟已记录在队列中，下次启动时重新接上
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        heartbeat.cancel()
+        self.close_results()
+        if self.finish_active:
+            logging.info("All active simulations processed. Exiting safely.")
+        else:
+            logging.info(f"Left {len(self.active_simulations)} active simulations in the queue for the next run. Exiting safely.")
+
+    def manage_simulations(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            self.handle_exit(signal.SIGINT, None)
+        finally:
+            self.executor.shutdown(wait=False)
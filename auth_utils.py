@@ -1,90 +1,364 @@
 import requests
 import json
+import os
+import random
+import re
 import time
 import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
-def retry_request(method, url, max_retries=10, timeout=300, delay=5, **kwargs):
+API_BASE = os.environ.get("BRAIN_API_BASE", "https://api.worldquantbrain.com")
+
+def parse_retry_after(value, default: float = 0):
+    """
+    解析 Retry-After 头，值可以是秒数或 HTTP 日期，返回还需等待的秒数。
+    为空或无法解析时返回 default。
+    """
+    if not value:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logging.warning(f"Invalid Retry-After header: {value}")
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0)
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限流器，多个线程共享同一个请求速率上限。
+    :param rate    : 每秒补充的令牌数
+    :param capacity: 桶容量 (允许的突发请求数)
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate     = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens   = self.capacity
+        self.updated  = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self.lock:
+                now          = time.monotonic()
+                self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+class SessionManager:
     """
-    通用的重试逻辑。
-    如果请求失败则进行重试，超时后重新登录。
-    如果重新登录超过 max_retries，则报错终止脚本。
-
-    :param method     : 请求方法 (e.g., SESS.get, SESS.patch)
-    :param url        : 请求的目标地址
-    :param max_retries: 最大重新登录次数
-    :param timeout    : 每次重试的超时时间
-    :param delay      : 两次请求的间隔时间
-    :param kwargs     : 请求参数 (e.g., json, headers)
+    管理 BRAIN 登录状态。
+    - 只在 401 或 token 即将过期时刷新，网络错误和 5xx 不触发重新登录
+    - 在 token 过期前 refresh_margin 秒主动刷新
+    - 多个线程同时请求刷新时合并为一次 (single-flight)，登录失败时排队等待的线程直接返回这次失败的结果
+    - 主动刷新失败后，在当前 token 仍然有效时 refresh_backoff 秒内不再主动刷新
+    - 刷新时复用同一个 Session，连接池保持可用
+    - 凭据只读取一次
+
+    :param credential_file: 凭据文件路径
+    :param pool_size      : 连接池大小
+    :param refresh_margin : 提前刷新的秒数
+    :param refresh_backoff: 主动刷新失败后再次主动刷新的最短间隔 (秒)
+    :param session        : 已登录的 Session (过期时间未知，直到遇到 401 才刷新)
+    :param credentials    : (username, password)，指定时不读取凭据文件
     """
-    retry_count = 0
-    start_time  = time.time()
-    while retry_count <= max_retries:
+    def __init__(self, credential_file: str = 'brain_credential.txt', pool_size: int = 32, refresh_margin: float = 300,
+                 refresh_backoff: float = 30, session=None, credentials=None):
+        self.credential_file = credential_file
+        self.refresh_margin  = refresh_margin
+        self.refresh_backoff = refresh_backoff
+        self.lock            = threading.Lock()
+        self.generation      = 0
+        self.expires_at      = 0
+        self.last_attempt_at = None
+        self.last_result     = None
+        self.user_id         = None
+        self.login_count     = 0
+        self.session         = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if session is not None:
+            self.expires_at = float('inf')
+        if credentials is not None:
+            self.session.auth = HTTPBasicAuth(*credentials)
+
+    def load_credentials(self):
+        if self.session.auth is None:
+            with open(self.credential_file) as f:
+                username, password = json.load(f)
+            self.session.auth = HTTPBasicAuth(username, password)
+
+    def authenticate(self):
+        """
+        在当前 Session 上重新认证，成功返回 True。
+        """
+        self.load_credentials()
         try:
-            response = method(url, **kwargs)
+            response = self.session.post(f'{API_BASE}/authentication', timeout=60)
             response.raise_for_status()
-            result = response.json()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Login to BRAIN failed: {e}")
+            return False
+        expiry          = (data.get("token") or {}).get("expiry", 4 * 3600)
+        self.expires_at = time.time() + float(expiry)
+        self.user_id    = (data.get("user") or {}).get("id")
+        self.generation  += 1
+        self.login_count += 1
+        logging.info(f"{self.user_id} Login to BRAIN successfully. Token expires in {float(expiry) / 60:.0f} minutes.")
+        return True
+
+    def refresh(self, seen_generation: int):
+        """
+        刷新登录状态。seen_generation 为调用方发现登录失效时看到的版本号，
+        如果其他线程已经完成刷新则直接返回，不重复登录；
+        等待锁期间其他线程的登录尝试已经结束 (无论成功与否) 时直接返回该次的结果。
+        """
+        requested_at = time.monotonic()
+        with self.lock:
+            if self.generation != seen_generation:
+                return True
+            if self.last_attempt_at is not None and self.last_attempt_at >= requested_at:
+                return self.last_result
+            result = self.authenticate()
+            self.last_attempt_at, self.last_result = time.monotonic(), result
             return result
-        except Exception as e:
-            elapsed_time = time.time() - start_time
-            if elapsed_time < timeout:
-                logging.warning(f"Request to {url} failed. Retrying after {delay} seconds... Elapsed time: {elapsed_time:.2f}s.")
-                time.sleep(delay)
+
+    def get_session(self):
+        # token 即将过期时主动刷新；上次刷新失败且 token 仍然有效时等待 refresh_backoff 秒再试
+        now = time.time()
+        if now >= self.expires_at - self.refresh_margin:
+            backing_off = self.last_result is False and time.monotonic() - self.last_attempt_at < self.refresh_backoff
+            if not (backing_off and now < self.expires_at):
+                self.refresh(self.generation)
+        return self.session
+
+class BrainClient:
+    """
+    所有脚本共用的 BRAIN HTTP 客户端。
+    - 连接池：同一个 Session 挂载可配置大小的 HTTPAdapter
+    - 限流：线程 / 协程共享的令牌桶
+    - 重试：网络错误、429 和 5xx 使用带抖动的指数退避，优先遵循服务端的 Retry-After
+    - 401 时通过 SessionManager 刷新登录后重试；其他 4xx 属于永久错误，不重试
+    - 按 endpoint 统计请求数、重试数、错误数和延迟
+    - 每次尝试和退避睡眠前调用 heartbeats 中的回调，长时间重试时调用方的心跳不会过期
+
+    :param rate           : 每秒请求数上限
+    :param capacity       : 令牌桶容量 (突发请求数)
+    :param pool_size      : 连接池大小
+    :param max_retries    : 单个请求的最大重试次数
+    :param backoff_base   : 指数退避的初始间隔 (秒)
+    :param backoff_max    : 指数退避的最大间隔 (秒)
+    :param timeout        : 单次请求超时 (秒)
+    :param session        : 已登录的 Session；为 None 时在第一次请求时登录
+    :param credential_file: 凭据文件路径
+    :param credentials    : (username, password)，用于多账号时为每个账号创建独立的客户端
+    """
+    def __init__(self, rate: float = 10, capacity: float = None, pool_size: int = 32, max_retries: int = 8,
+                 backoff_base: float = 1, backoff_max: float = 60, timeout: float = 60, session=None,
+                 credential_file: str = 'brain_credential.txt', credentials=None):
+        self.limiter         = TokenBucket(rate, capacity)
+        self.pool_size       = pool_size
+        self.max_retries     = max_retries
+        self.backoff_base    = backoff_base
+        self.backoff_max     = backoff_max
+        self.timeout         = timeout
+        self.sessions        = SessionManager(credential_file, pool_size=pool_size, session=session, credentials=credentials)
+        self.stats_lock      = threading.Lock()
+        self.stats           = {}
+        self.heartbeats      = []
+
+    def beat(self):
+        for heartbeat in self.heartbeats:
+            heartbeat()
+
+    def ensure_session(self):
+        return self.sessions.get_session()
+
+    @staticmethod
+    def endpoint(method, url):
+        path     = urlparse(url).path
+        segments = [seg if re.fullmatch(r'[a-z][a-z-]*', seg) else '{id}' for seg in path.strip('/').split('/')]
+        return f"{method} /{'/'.join(segments)}"
+
+    def record(self, endpoint, latency=None, retry=False, error=False):
+        with self.stats_lock:
+            stat = self.stats.setdefault(endpoint, {"requests": 0, "retries": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0})
+            if latency is not None:
+                stat["requests"]      += 1
+                stat["latency_total"] += latency
+                stat["latency_max"]    = max(stat["latency_max"], latency)
+            stat["retries"] += int(retry)
+            stat["errors"]  += int(error)
+
+    def backoff(self, attempt, response=None):
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"), None)
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def request(self, method: str, url: str, max_retries: int = None, return_statuses=(), **kwargs):
+        """
+        发送请求，成功 (状态码 < 400) 时返回 Response，失败时返回 None。
+        状态码在 return_statuses 中时不重试，直接返回 Response 交给调用方处理 (例如提交模拟时的 429)。
+        """
+        method      = method.upper()
+        url         = url if url.startswith('http') else API_BASE + url
+        endpoint    = self.endpoint(method, url)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(max_retries + 1):
+            self.beat()
+            session    = self.sessions.get_session()
+            generation = self.sessions.generation
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.record(endpoint, time.monotonic() - start, error=True)
+                delay = self.backoff(attempt)
+                logging.warning(f"{method} {url} failed: {e}. Retrying in {delay:.1f}s... ({attempt + 1}/{max_retries})")
             else:
-                if retry_count < max_retries:
-                    logging.warning(f"Timeout reached. Attempting re-login... (Retry count: {retry_count + 1})")
-                    global SESS
-                    SESS = global_sign_in()
-                    start_time = time.time()
-                    retry_count += 1
+                self.record(endpoint, time.monotonic() - start)
+                if response.status_code < 400:
+                    return response
+                self.record(endpoint, error=True)
+                if response.status_code in return_statuses:
+                    return response
+                if response.status_code == 401:
+                    logging.warning(f"{method} {url} returned 401, refreshing authentication.")
+                    delay = 0 if self.sessions.refresh(generation) else self.backoff(attempt)
+                elif response.status_code == 429 or response.status_code >= 500:
+                    delay = self.backoff(attempt, response)
+                    logging.warning(f"{method} {url} returned {response.status_code}. Retrying in {delay:.1f}s... ({attempt + 1}/{max_retries})")
                 else:
-                    logging.error(f"Request to {url} failed after {max_retries} re-login attempts.")
+                    logging.error(f"{method} {url} returned {response.status_code}: {response.text[:200]}")
                     return None
-                    #raise RuntimeError(f"Request to {url} failed after {max_retries} re-login attempts.") from e
+            if attempt < max_retries:
+                self.record(endpoint, retry=True)
+                self.beat()
+                time.sleep(delay)
+        logging.error(f"{method} {url} failed after {max_retries} retries.")
+        return None
+
+    def request_json(self, method: str, url: str, **kwargs):
+        response = self.request(method, url, **kwargs)
+        if response is None:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            logging.error(f"{method} {url} returned invalid JSON.")
+            return None
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def wait_json(self, url: str, max_wait: float = 600, default_delay: float = 5):
+        """
+        轮询 GET 请求直到服务端不再返回 Retry-After (例如 /alphas/{id}/check)，返回 JSON。
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            response = self.get(url)
+            if response is None:
+                return None
+            header      = response.headers.get("Retry-After")
+            retry_after = parse_retry_after(header, default_delay) if header else 0
+            if retry_after == 0 and response.content:
+                try:
+                    return response.json()
+                except ValueError:
+                    pass
+            if time.monotonic() >= deadline:
+                logging.error(f"GET {url} still pending after {max_wait}s.")
+                return None
+            self.beat()
+            time.sleep(retry_after or default_delay)
+
+    def stats_report(self):
+        with self.stats_lock:
+            report = {}
+            for endpoint, stat in self.stats.items():
+                report[endpoint] = {
+                    "requests": stat["requests"],
+                    "retries": stat["retries"],
+                    "errors": stat["errors"],
+                    "latency_avg": round(stat["latency_total"] / stat["requests"], 3) if stat["requests"] else None,
+                    "latency_max": round(stat["latency_max"], 3),
+                }
+            return report
 
-def setup_logging(level=logging.INFO, log_file='app.log', log_to_file=True, log_to_console=True):
+    def log_stats(self):
+        for endpoint, stat in sorted(self.stats_report().items()):
+            logging.info(f"{endpoint}: {stat}")
+
+CLIENT      = None
+CLIENT_LOCK = threading.Lock()
+
+def get_client(**kwargs):
+    """
+    返回进程内共享的 BrainClient，第一次调用时按 kwargs 创建。
+    """
+    global CLIENT
+    with CLIENT_LOCK:
+        if CLIENT is None:
+            CLIENT = BrainClient(**kwargs)
+        return CLIENT
+
+def setup_logging(level=logging.INFO, log_file='app.log', log_to_file=True, log_to_console=True, mode='w'):
     """
     设置日志配置，可选择输出到控制台和文件。
     :param level: 日志级别，默认为 INFO
     :param log_file: 日志文件路径，默认为 'app.log'
     :param log_to_file: 是否将日志输出到文件，默认为 True
     :param log_to_console: 是否将日志输出到终端，默认为 True
+    :param mode: 日志文件打开模式，'w' 覆盖，'a' 追加
     """
     handlers = []
     if log_to_console:
         handlers.append(logging.StreamHandler())
     if log_to_file:
-        handlers.append(logging.FileHandler(log_file, mode='w'))
+        handlers.append(logging.FileHandler(log_file, mode=mode))
     logging.basicConfig(
         level=level,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=handlers
     )
 
-def global_sign_in():
-    credential_file = 'brain_credential.txt'
-    with open(credential_file) as f:
-        username,password = json.load(f)
-
-    sess       = requests.Session()
-    sess.auth  = HTTPBasicAuth(username,password)
-    timeout    = 300
-    start_time = time.time()
-    while True:
-        try:
-            response = sess.post('https://api.worldquantbrain.com/authentication')
-            response.raise_for_status()
-            break
-        except:
-            elapsed_time = time.time() - start_time
-            print("Connection down, trying to login again...")
-            if elapsed_time >= timeout:
-                print(f"{username} login Failed, returning None.")
-                return None
-            time.sleep(15)
-    id = response.json().get("user").get("id")
-    print(f"{id} Login to BRAIN successfully.")
-    return sess
+def global_sign_in(credential_file: str = 'brain_credential.txt'):
+    """
+    登录 BRAIN 并返回 requests.Session，失败时返回 None。
+    新代码应通过 BrainClient / SessionManager 使用会话。
+    """
+    sessions = SessionManager(credential_file)
+    if sessions.authenticate():
+        return sessions.session
+    return None
 
 if __name__ == "__main__":
     SESS = global_sign_in()
@@ -0,0 +1,227 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from mock_brain_server import MockBrainServer
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index  = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return round(values[index], 3)
+
+def summarize(name, count, elapsed, server_stats, extra=None):
+    latencies = server_stats["alpha_latencies"]
+    report = {
+        "benchmark": name,
+        "alphas": count,
+        "elapsed": round(elapsed, 2),
+        "alphas_per_hour": round(count * 3600 / elapsed, 1) if elapsed else None,
+        "requests": server_stats["total_requests"],
+        "requests_per_alpha": round(server_stats["total_requests"] / count, 2) if count else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+    }
+    report.update(extra or {})
+    return report
+
+def bench_simulator(server, alphas: int = 100, max_concurrent: int = 10, multi_size: int = 1, engine: str = 'sync', rate: float = 50):
+    """
+    在模拟服务器上运行 AlphaSimulator (或异步引擎)，直到队列中的 Alpha 全部完成。
+    端到端延迟为服务端记录的 模拟创建 -> 最后一次获取 Alpha 详情 的时间。
+    """
+    from auth_utils import BrainClient
+    from alpha_queue import AlphaQueue, DONE, FAILED
+    from alpha_simulator import AlphaSimulator
+    from async_simulator import AsyncAlphaSimulator
+
+    queue = AlphaQueue('alphas_queue.db')
+    queue.put_many({"type": "REGULAR", "settings": {"region": "USA", "universe": "TOP3000", "decay": i % 5},
+                    "regular": f"rank(field_{i})"} for i in range(alphas))
+    client  = BrainClient(rate=rate, capacity=rate, pool_size=max_concurrent * 2 + 4, credentials=("bench", "bench"))
+    kwargs  = dict(max_concurrent=max_concurrent, alpha_list_file='alphas_pending_simulated.csv', queue_db='alphas_queue.db',
+                   multi_size=multi_size, client=client)
+    if engine == 'async':
+        simulator = AsyncAlphaSimulator(poll_interval=server.retry_after, **kwargs)
+    else:
+        simulator = AlphaSimulator(**kwargs)
+        simulator.scheduler.default_delay = server.retry_after
+
+    def stop_when_done():
+        while not simulator.terminate:
+            counts = queue.counts()
+            if counts[DONE] + counts[FAILED] >= alphas:
+                simulator.terminate = True
+            time.sleep(0.2)
+
+    server.reset_stats()
+    start = time.monotonic()
+    threading.Thread(target=stop_when_done, daemon=True).start()
+    simulator.manage_simulations()
+    simulator.drain()
+    elapsed = time.monotonic() - start
+
+    counts = queue.counts()
+    queue.close()
+    simulator.queue.close()
+    poll_stats = simulator.scheduler.stats()
+    return summarize(f"simulator[{engine}, concurrent={max_concurrent}, multi={multi_size}]", counts[DONE], elapsed, server.stats(), {
+        "failed": counts[FAILED],
+        "slot_utilization": round(poll_stats["slot_utilization"], 3) if poll_stats["slot_utilization"] is not None else None,
+        "polls_per_completed": poll_stats["polls_per_completed"],
+    })
+
+def bench_recovery(server, alphas: int = 20, max_concurrent: int = 10, rate: float = 50):
+    """
+    重启恢复：队列中有 alphas 个由已不在本次运行中的账号提交的 SUBMITTED Alpha (指纹已记为 SIMULATED)，
+    启动单账号 Simulator，这些 Alpha 应当回到队列并重新模拟完成，而不是被标记为 DUPLICATE。
+    """
+    from auth_utils import BrainClient
+    from alpha_dedupe import FingerprintIndex, SIMULATED
+    from alpha_queue import AlphaQueue, DONE, DUPLICATE, FAILED
+    from alpha_simulator import AlphaSimulator
+
+    queue        = AlphaQueue('alphas_queue.db')
+    fingerprints = FingerprintIndex('alpha_fingerprints.db')
+    queue.put_many({"type": "REGULAR", "settings": {"region": "USA", "universe": "TOP3000", "decay": i % 5},
+                    "regular": f"rank(orphan_{i})"} for i in range(alphas))
+    batch = queue.dequeue(alphas)
+    for qid, alpha in batch:
+        queue.mark_submitted([qid], f"http://inactive-owner/simulations/{qid}", "inactive")
+    fingerprints.add_alphas([alpha for _, alpha in batch], SIMULATED)
+
+    client    = BrainClient(rate=rate, capacity=rate, pool_size=max_concurrent * 2 + 4, credentials=("bench", "bench"))
+    simulator = AlphaSimulator(max_concurrent=max_concurrent, alpha_list_file='alphas_pending_simulated.csv', queue_db='alphas_queue.db',
+                               client=client, fingerprints=fingerprints)
+    simulator.scheduler.default_delay = server.retry_after
+
+    def stop_when_done():
+        while not simulator.terminate:
+            counts = queue.counts()
+            if counts[DONE] + counts[FAILED] + counts[DUPLICATE] >= alphas:
+                simulator.terminate = True
+            time.sleep(0.2)
+
+    server.reset_stats()
+    start = time.monotonic()
+    threading.Thread(target=stop_when_done, daemon=True).start()
+    simulator.manage_simulations()
+    elapsed = time.monotonic() - start
+
+    counts = queue.counts()
+    queue.close()
+    simulator.queue.close()
+    return summarize("recovery[inactive owner]", counts[DONE], elapsed, server.stats(), {
+        "failed": counts[FAILED],
+        "duplicate": counts[DUPLICATE],
+    })
+
+def bench_check(server, workers: int = 8, submit: bool = False, rate: float = 50):
+    """
+    在模拟服务器上运行 alpha_check 的完整流程 (分页筛选 -> mark -> check [-> submit])。
+    端到端延迟为服务端记录的 每个 Alpha 第一次到最后一次请求的时间。
+    """
+    import alpha_check
+    from auth_utils import BrainClient
+
+    alpha_check.CLIENT       = BrainClient(rate=rate, capacity=rate, pool_size=workers * 4 + 4, credentials=("bench", "bench"))
+    alpha_check.RESULT_STORE = None
+    stage_workers = {"mark": workers, "check": workers, "submit": max(1, workers // 4), "wait": workers}
+
+    server.reset_stats()
+    start   = time.monotonic()
+    runner  = alpha_check.get_submited_alphas if submit else alpha_check.get_checked_alphas
+    passed  = runner(stage_workers)
+    elapsed = time.monotonic() - start
+    stats   = server.stats()
+    return summarize(f"check[workers={workers}, submit={submit}]", len(stats["alpha_latencies"]), elapsed, stats, {"passed": len(passed)})
+
+def bench_datafields(server, repeats: int = 5, rate: float = 50):
+    """
+    分别测量 get_datafields 的三种情况：缓存未命中 (全部分页)、缓存命中、缓存过期但内容未变 (304 续期)。
+    """
+    import alpha_creator
+    from auth_utils import BrainClient
+
+    reports = []
+    for mode in ("cold", "warm", "revalidate"):
+        client = BrainClient(rate=rate, capacity=rate, credentials=("bench", "bench"))
+        alpha_creator.DATAFIELD_CACHE_TTL = 0 if mode == "revalidate" else 86400
+        if mode != "cold":
+            alpha_creator.get_datafields(client, "EQUITY", "USA", 1, "TOP3000", "bench")
+        server.reset_stats()
+        durations = []
+        for _ in range(repeats):
+            start = time.monotonic()
+            fields = alpha_creator.get_datafields(client, "EQUITY", "USA", 1, "TOP3000", "bench", refresh=(mode == "cold"))
+            durations.append(time.monotonic() - start)
+        stats = server.stats()
+        reports.append({
+            "benchmark": f"datafields[{mode}]",
+            "fields": len(fields),
+            "runs": repeats,
+            "requests_per_run": round(stats["total_requests"] / repeats, 2),
+            "latency_p50": percentile(durations, 50),
+            "latency_p99": percentile(durations, 99),
+            "latency_mean": round(statistics.mean(durations), 3),
+        })
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulator, checker and datafield catalog against a local mock BRAIN server.")
+    parser.add_argument("--suite", nargs="+", choices=["simulator", "recovery", "check", "datafields"],
+                        default=["simulator", "recovery", "check", "datafields"])
+    parser.add_argument("--engine", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--alphas", type=int, default=100, help="alphas to simulate / to seed for the check benchmark")
+    parser.add_argument("--max-concurrent", type=int, default=10)
+    parser.add_argument("--multi-size", type=int, default=1, choices=range(1, 11), metavar="1-10")
+    parser.add_argument("--check-workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=50, help="client request rate limit (requests per second)")
+    parser.add_argument("--latency", type=float, default=0.02, help="injected latency per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--sim-duration", type=float, default=2)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--datafield-count", type=int, default=2000)
+    parser.add_argument("--output", type=str, default=None, help="write the reports to this JSON file")
+    args = parser.parse_args()
+
+    server = MockBrainServer(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate, throttle_rate=args.throttle_rate,
+                             throttle_retry_after=args.retry_after, sim_duration=args.sim_duration, check_duration=args.retry_after,
+                             retry_after=args.retry_after, datafield_count=args.datafield_count, alpha_count=args.alphas, seed=0)
+    base_url = server.start()
+    # 必须在导入其他模块之前设置，API_BASE 在导入时读取
+    os.environ["BRAIN_API_BASE"] = base_url
+    output  = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="brain_bench_")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler(os.path.join(workdir, 'benchmark.log'), mode='w')])
+    print(f"Mock server: {base_url}, working directory: {workdir}")
+
+    reports = []
+    if "simulator" in args.suite:
+        for engine in args.engine:
+            # 每次运行使用独立的目录，队列、去重索引和结果文件互不影响
+            os.chdir(tempfile.mkdtemp(prefix=f"{engine}_", dir=workdir))
+            reports.append(bench_simulator(server, args.alphas, args.max_concurrent, args.multi_size, engine, args.rate))
+    if "recovery" in args.suite:
+        os.chdir(tempfile.mkdtemp(prefix="recovery_", dir=workdir))
+        reports.append(bench_recovery(server, min(args.alphas, 20), args.max_concurrent, args.rate))
+    os.chdir(workdir)
+    if "check" in args.suite:
+        reports.append(bench_check(server, args.check_workers, rate=args.rate))
+    if "datafields" in args.suite:
+        reports.extend(bench_datafields(server, rate=args.rate))
+    server.stop()
+
+    for report in reports:
+        print(json.dumps(report))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(reports, f, indent=2)
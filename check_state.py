@@ -0,0 +1,134 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+PENDING   = 'PENDING'
+PASS      = 'PASS'
+FAIL      = 'FAIL'
+ERROR     = 'ERROR'
+SUBMITTED = 'SUBMITTED'
+
+# 这些检查项的结果会随已提交 / 生产 Alpha 的变化而变化，失败后过一段时间可以重新检查
+RETRYABLE_CHECKS = {'SELF_CORRELATION', 'PROD_CORRELATION'}
+
+def parse_date(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+class CheckStateStore:
+    """
+    记录每个 Alpha 的 Check Submission 状态，使重复运行 alpha_check 只处理新的或可以重新检查的 Alpha。
+    - PENDING  : 已获取但还没有检查 (上次运行中断等)，下次运行会检查
+    - ERROR    : mark / check / submit 请求失败，或检查结果没有 FAIL 项但仍有 PENDING / WARNING 项，下次运行会重新检查
+    - FAIL     : 至少一个检查项 FAIL。只有 RETRYABLE_CHECKS 失败时，距上次检查超过 retry_interval 秒后重新检查；其他检查项失败不再检查
+    - PASS     : 提交模式下总是重新检查 (提交前需要最新的检查结果)；只检查时超过 retry_interval 秒后重新检查
+    - SUBMITTED: 已提交，不再检查
+    另外记录已获取的 Alpha 中最大的 dateCreated，按 -dateCreated 分页时遇到不晚于它的 Alpha 即可停止。
+
+    :param db_path       : SQLite 数据库文件路径
+    :param retry_interval: 可重试的失败和 PASS 重新检查的间隔 (秒)
+    """
+    def __init__(self, db_path: str = 'alpha_check_state.db', retry_interval: float = 7 * 86400):
+        self.db_path        = db_path
+        self.retry_interval = retry_interval
+        self.lock           = threading.Lock()
+        self.conn           = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS check_state (
+                alpha_id     TEXT PRIMARY KEY,
+                date_created TEXT,
+                outcome      TEXT NOT NULL,
+                failed       TEXT,
+                checked_at   REAL,
+                alpha        TEXT
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @property
+    def high_water_mark(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'date_created'").fetchone()
+        return row[0] if row else None
+
+    def add_alphas(self, alphas):
+        """
+        记录新获取的 Alpha (已有记录的不变)，并把 dateCreated 高水位推进到其中最晚的一个。
+        先写入 PENDING 记录再推进高水位，运行中断时这些 Alpha 下次仍会被检查。
+        """
+        alphas = list(alphas)
+        if not alphas:
+            return
+        latest = max((alpha.get("dateCreated") for alpha in alphas if alpha.get("dateCreated")), key=parse_date, default=None)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("INSERT OR IGNORE INTO check_state (alpha_id, date_created, outcome, alpha) VALUES (?, ?, ?, ?)",
+                                  [(alpha["id"], alpha.get("dateCreated"), PENDING, json.dumps(alpha)) for alpha in alphas])
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'date_created'").fetchone()
+            if latest and (row is None or parse_date(latest) > parse_date(row[0])):
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('date_created', ?)", (latest,))
+            self.conn.execute("COMMIT")
+
+    def record(self, alpha_id: str, outcome: str, failed=None):
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO check_state (alpha_id, outcome, failed, checked_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(alpha_id) DO UPDATE SET outcome = excluded.outcome, failed = excluded.failed, checked_at = excluded.checked_at
+            """, (alpha_id, outcome, json.dumps(failed or []), time.time()))
+
+    def is_eligible(self, outcome, failed, checked_at, submit=False, now=None):
+        if outcome in (None, PENDING, ERROR):
+            return True
+        if outcome == SUBMITTED:
+            return False
+        expired = (now or time.time()) - (checked_at or 0) >= self.retry_interval
+        if outcome == PASS:
+            return submit or expired
+        return expired and bool(failed) and set(failed) <= RETRYABLE_CHECKS
+
+    def eligible(self, alphas, submit: bool = False):
+        """
+        从 alphas 中筛选需要检查的 Alpha (没有记录的 Alpha 总是需要检查)。
+        """
+        states = self.states([alpha["id"] for alpha in alphas])
+        now    = time.time()
+        return [alpha for alpha in alphas if alpha["id"] not in states or self.is_eligible(*states[alpha["id"]], submit=submit, now=now)]
+
+    def eligible_alphas(self, submit: bool = False):
+        """
+        返回所有已记录且需要重新检查的 Alpha (获取时保存的 Alpha 数据)。
+        """
+        now = time.time()
+        with self.lock:
+            # 先在 SQL 中排除不可能需要检查的记录，避免每次读取全部 Alpha 数据
+            rows = self.conn.execute("""
+                SELECT outcome, failed, checked_at, alpha FROM check_state
+                WHERE alpha IS NOT NULL AND (outcome IN (?, ?) OR (outcome = ? AND ?) OR (outcome IN (?, ?) AND checked_at <= ?))
+            """, (PENDING, ERROR, PASS, int(submit), PASS, FAIL, now - self.retry_interval)).fetchall()
+        return [json.loads(alpha) for outcome, failed, checked_at, alpha in rows
+                if self.is_eligible(outcome, json.loads(failed or '[]'), checked_at, submit=submit, now=now)]
+
+    def states(self, alpha_ids):
+        states, alpha_ids = {}, list(alpha_ids)
+        with self.lock:
+            for start in range(0, len(alpha_ids), 500):
+                chunk = alpha_ids[start:start + 500]
+                rows  = self.conn.execute(f"SELECT alpha_id, outcome, failed, checked_at FROM check_state WHERE alpha_id IN ({','.join('?' * len(chunk))})",
+                                          chunk).fetchall()
+                states.update({alpha_id: (outcome, json.loads(failed or '[]'), checked_at) for alpha_id, outcome, failed, checked_at in rows})
+        return states
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT outcome, COUNT(*) FROM check_state GROUP BY outcome").fetchall())
+
+    def log_counts(self):
+        logging.info(f"Check state: {self.counts()}, dateCreated high-water mark {self.high_water_mark}.")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
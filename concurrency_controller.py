@@ -0,0 +1,54 @@
+import logging
+import threading
+import time
+
+class ConcurrencyController:
+    """
+    AIMD (加性增 / 乘性减) 并发窗口控制器，用于自动探测账号当前允许的同时模拟数。
+    - 提交成功且窗口已被占满时，每完成一个窗口的提交窗口加 increase (每次成功加 increase / limit)
+    - 提交遇到 429 / 并发数超限时窗口乘以 decrease，cooldown 秒内的多次限流只减一次
+    窗口的整数部分即当前的并发上限，每次变化都会写入日志并记录在 history 中。
+
+    :param initial  : 初始窗口
+    :param min_limit: 窗口下限
+    :param max_limit: 窗口上限
+    :param increase : 每个窗口的加性增量
+    :param decrease : 限流时的乘性因子
+    :param cooldown : 两次减小窗口之间的最小间隔 (秒)
+    """
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = None, increase: float = 1, decrease: float = 0.5,
+                 cooldown: float = 30):
+        self.min_limit  = min_limit
+        self.max_limit  = max_limit if max_limit is not None else initial
+        self.limit      = float(min(max(initial, min_limit), self.max_limit))
+        self.increase   = increase
+        self.decrease   = decrease
+        self.cooldown   = cooldown
+        self.last_drop  = 0.0
+        self.lock       = threading.Lock()
+        self.history    = [(time.time(), self.window)]
+
+    @property
+    def window(self):
+        return int(self.limit)
+
+    def update(self, limit, reason):
+        old_window = self.window
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        if self.window != old_window:
+            self.history.append((time.time(), self.window))
+            logging.info(f"Concurrency limit {old_window} -> {self.window} ({reason}).")
+
+    def on_success(self, in_flight: int):
+        # 窗口没有被占满 (队列为空等) 时不增加，避免窗口无限增长
+        with self.lock:
+            if in_flight >= self.window:
+                self.update(self.limit + self.increase / self.limit, "submit succeeded")
+
+    def on_throttle(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_drop < self.cooldown:
+                return
+            self.last_drop = now
+            self.update(self.limit * self.decrease, "submit throttled")
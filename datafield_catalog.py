@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from auth_utils import API_BASE
+
+class DataFieldCatalog:
+    """
+    /data-fields 的本地缓存。
+    以 instrumentType / region / delay / universe / dataset (或 search) 为键，
+    缓存以 DataFrame (type 列为 category) 形式保存，便于按 type 快速筛选。
+    缓存过期后先只请求第一页做校验 (服务端 ETag 或 count + 第一页内容的哈希)，
+    未变化则直接续期；缓存未命中时并发拉取所有分页。
+
+    :param client     : 共享的 BrainClient (第一次请求时才登录)
+    :param cache_dir  : 缓存目录
+    :param ttl        : 缓存有效期 (秒)
+    :param page_size  : 每页数量
+    :param max_workers: 并发拉取分页的线程数
+    """
+    def __init__(self, client, cache_dir: str = 'datafield_cache', ttl: float = 86400, page_size: int = 50, max_workers: int = 8):
+        self.client      = client
+        self.cache_dir   = cache_dir
+        self.ttl         = ttl
+        self.page_size   = page_size
+        self.max_workers = max_workers
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def url_template(self, instrument_type, region, delay, universe, dataset_filed, search):
+        url_template = f"{API_BASE}/data-fields?" +\
+            f"&instrumentType={instrument_type}" +\
+            f"&region={region}&delay={str(delay)}&universe={universe}&limit={self.page_size}"
+        if len(search) == 0:
+            url_template += f"&dataset.id={dataset_filed}"
+        else:
+            url_template += f"&search={search}"
+        return url_template + "&offset={x}"
+
+    def cache_path(self, instrument_type, region, delay, universe, dataset_filed, search):
+        key  = json.dumps([instrument_type, region, delay, universe, dataset_filed, search])
+        name = f"{instrument_type}_{region}_{delay}_{universe}_{dataset_filed or 'search'}_{hashlib.sha1(key.encode()).hexdigest()[:10]}"
+        return os.path.join(self.cache_dir, name)
+
+    def fetch_page(self, url_template, offset, headers=None):
+        url      = url_template.format(x=offset)
+        response = self.client.get(url, headers=headers or {})
+        if response is None:
+            raise RuntimeError(f"Request to {url} Failed.")
+        if response.status_code == 304:
+            return response, None
+        return response, response.json()
+
+    def page_signature(self, response, page):
+        # 服务端返回 ETag 时直接使用，否则以 count + 第一页内容的哈希作为版本标识
+        etag = response.headers.get("ETag")
+        if etag:
+            return etag
+        content = json.dumps([page.get('count'), page.get('results')], sort_keys=True)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def fetch_all(self, url_template, first_page):
+        count   = first_page.get('count', 0)
+        offsets = range(self.page_size, count, self.page_size)
+        self.client.ensure_session()  # 在主线程中完成登录，避免多个线程同时登录
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pages = list(executor.map(lambda offset: self.fetch_page(url_template, offset)[1], offsets))
+        datafields_list_flat = list(first_page.get('results', []))
+        for page in pages:
+            datafields_list_flat.extend(page['results'])
+        datafields_df = pd.DataFrame(datafields_list_flat)
+        if 'type' in datafields_df:
+            datafields_df['type'] = datafields_df['type'].astype('category')
+        return datafields_df
+
+    def load(self, path):
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            return pd.read_pickle(path + '.pkl'), meta
+        except (FileNotFoundError, ValueError, EOFError):
+            return None, None
+
+    def save(self, path, datafields_df, meta):
+        datafields_df.to_pickle(path + '.pkl.tmp')
+        os.replace(path + '.pkl.tmp', path + '.pkl')
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def get(self, instrument_type: str, region: str, delay: int, universe: str, dataset_filed: str, search: str = '', refresh: bool = False):
+        path                = self.cache_path(instrument_type, region, delay, universe, dataset_filed, search)
+        url_template        = self.url_template(instrument_type, region, delay, universe, dataset_filed, search)
+        datafields_df, meta = (None, None) if refresh else self.load(path)
+
+        if meta and time.time() - meta['fetched_at'] < self.ttl:
+            logging.info(f"Datafield catalog cache hit: {path}")
+            return datafields_df
+
+        headers = {"If-None-Match": meta['signature']} if meta else None
+        response, first_page = self.fetch_page(url_template, 0, headers)
+        if meta and (first_page is None or self.page_signature(response, first_page) == meta['signature']):
+            logging.info(f"Datafield catalog unchanged, renewing cache: {path}")
+            meta['fetched_at'] = time.time()
+            self.save(path, datafields_df, meta)
+            return datafields_df
+
+        datafields_df = self.fetch_all(url_template, first_page)
+        self.save(path, datafields_df, {
+            'fetched_at': time.time(),
+            'signature': self.page_signature(response, first_page),
+            'count': first_page.get('count', 0),
+        })
+        logging.info(f"Datafield catalog fetched: {len(datafields_df)} fields cached to {path}")
+        return datafields_df
@@ -0,0 +1,358 @@
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+def correlation(x, y):
+    n      = len(x)
+    mean_x = sum(x) / n
+    mean_y = sum(y) / n
+    cov    = sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y))
+    var_x  = sum((a - mean_x) ** 2 for a in x)
+    var_y  = sum((b - mean_y) ** 2 for b in y)
+    return cov / math.sqrt(var_x * var_y) if var_x > 0 and var_y > 0 else 0.0
+
+class MockBrainServer:
+    """
+    本地模拟的 BRAIN API，用于在不消耗真实配额的情况下测量 Simulator / Check / Creator 的性能。
+    支持 /authentication、/simulations (Location + Retry-After，包括 multi-simulation)、/alphas/{id}、
+    /alphas/{id}/check、/alphas/{id}/submit、/alphas/{id}/recordsets/pnl、/data-fields (分页 + ETag) 和 /users/self/alphas (分页 + 筛选)。
+    每个 Alpha 的 PnL 由 pnl_factors 个公共因子之一 (按表达式选择) 加上自身噪声生成，
+    /check 的 SELF_CORRELATION 为该 Alpha 与所有 ACTIVE Alpha 的日 PnL 最大相关系数。
+    可以注入固定延迟、随机 5xx 失败和随机 429 限流，并记录每个 Alpha 从提交 (或第一次请求) 到最后一次请求的时间。
+
+    :param host                 : 监听地址
+    :param port                 : 监听端口，0 表示随机端口
+    :param latency              : 每个请求的固定延迟 (秒)
+    :param jitter               : 在固定延迟上再加 [0, jitter] 的随机延迟 (秒)
+    :param failure_rate         : 返回 500 的概率
+    :param throttle_rate        : 返回 429 的概率
+    :param throttle_retry_after : 429 响应中的 Retry-After (秒)
+    :param sim_duration         : 每个模拟的耗时 (秒)
+    :param check_duration       : /check 的计算耗时 (秒)
+    :param retry_after          : 模拟和 /check 未完成时返回的 Retry-After (秒)
+    :param concurrent_limit     : 同时进行的模拟数上限，超过时 POST /simulations 返回 429，None 表示不限制
+    :param datafield_count      : /data-fields 返回的字段数量
+    :param alpha_count          : 预先生成的 UNSUBMITTED Alpha 数量 (用于 alpha_check)
+    :param pnl_days             : PnL 的天数
+    :param pnl_factors          : 生成 PnL 的公共因子数量
+    :param seed                 : 随机种子
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, throttle_rate: float = 0.0, throttle_retry_after: float = 1,
+                 sim_duration: float = 2, check_duration: float = 1, retry_after: float = 1, concurrent_limit: int = None,
+                 datafield_count: int = 500, alpha_count: int = 0, pnl_days: int = 1000, pnl_factors: int = 20, seed=None):
+        self.latency              = latency
+        self.jitter               = jitter
+        self.failure_rate         = failure_rate
+        self.throttle_rate        = throttle_rate
+        self.throttle_retry_after = throttle_retry_after
+        self.sim_duration         = sim_duration
+        self.check_duration       = check_duration
+        self.retry_after          = retry_after
+        self.concurrent_limit     = concurrent_limit
+        self.pnl_days             = pnl_days
+        self.pnl_factors          = pnl_factors
+        self.pnl_returns          = {}
+        self.rng                  = random.Random(seed)
+        self.lock                 = threading.Lock()
+        self.ids                  = itertools.count(1)
+        self.simulations          = {}
+        self.alphas               = {}
+        self.checks               = {}
+        self.timeline             = {}
+        self.requests             = {}
+        self.datafields           = [{"id": f"field_{i}", "type": "MATRIX" if i % 5 else "VECTOR", "coverage": 1.0}
+                                     for i in range(datafield_count)]
+        for _ in range(alpha_count):
+            self.new_alpha(f"rank(field_{self.rng.randrange(max(datafield_count, 1))})", {}, track=False)
+
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = {}
+            self.timeline = {}
+
+    def stats(self):
+        """
+        返回每个 endpoint 的请求数 (包括注入的 429 / 500) 和每个 Alpha 的端到端耗时列表。
+        """
+        with self.lock:
+            latencies = [end - start for start, end in self.timeline.values() if end is not None]
+            return {"requests": dict(self.requests), "total_requests": sum(self.requests.values()), "alpha_latencies": latencies}
+
+    def new_id(self, prefix):
+        return f"{prefix}{next(self.ids):07d}"
+
+    def new_alpha(self, code, settings, track=True):
+        alpha_id = self.new_id("A")
+        sharpe   = round(self.rng.gauss(1.0, 0.6), 2)
+        fitness  = round(sharpe * self.rng.uniform(0.5, 1.2), 2)
+        turnover = round(self.rng.uniform(0.005, 0.9), 4)
+        checks   = [
+            {"name": "LOW_SHARPE", "result": "PASS" if sharpe > 1.25 else "FAIL", "limit": 1.25, "value": sharpe},
+            {"name": "LOW_FITNESS", "result": "PASS" if fitness > 1 else "FAIL", "limit": 1.0, "value": fitness},
+            {"name": "LOW_TURNOVER", "result": "PASS" if turnover > 0.01 else "FAIL", "limit": 0.01, "value": turnover},
+            {"name": "HIGH_TURNOVER", "result": "PASS" if turnover < 0.7 else "FAIL", "limit": 0.7, "value": turnover},
+        ]
+        self.alphas[alpha_id] = {
+            "id": alpha_id, "type": "REGULAR", "status": "UNSUBMITTED", "color": None, "settings": settings,
+            "regular": {"code": code}, "dateCreated": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "is": {"sharpe": sharpe, "fitness": fitness, "turnover": turnover, "returns": round(self.rng.gauss(0.08, 0.05), 4),
+                   "drawdown": round(self.rng.uniform(0.01, 0.3), 4), "margin": round(self.rng.uniform(0, 0.002), 6), "checks": checks},
+        }
+        if track:
+            self.timeline[alpha_id] = [time.monotonic(), None]
+        return alpha_id
+
+    def touch(self, alpha_id):
+        now   = time.monotonic()
+        entry = self.timeline.setdefault(alpha_id, [now, None])
+        entry[1] = now
+
+    def running_simulations(self):
+        now = time.monotonic()
+        return sum(1 for sim in self.simulations.values() if "children" not in sim and now - sim["created"] < self.sim_duration)
+
+    def create_simulation(self, payload):
+        items = payload if isinstance(payload, list) else [payload]
+        with self.lock:
+            if self.concurrent_limit is not None and self.running_simulations() + len(items) > self.concurrent_limit:
+                return None
+            now = time.monotonic()
+            children = []
+            for item in items:
+                regular = item.get("regular", "")
+                sim_id  = self.new_id("S")
+                self.simulations[sim_id] = {"created": now, "alpha": self.new_alpha(regular, item.get("settings", {}))}
+                children.append(sim_id)
+            if not isinstance(payload, list):
+                return children[0]
+            parent_id = self.new_id("S")
+            self.simulations[parent_id] = {"created": now, "children": children}
+            return parent_id
+
+    def simulation_progress(self, sim_id):
+        with self.lock:
+            sim = self.simulations.get(sim_id)
+            if sim is None:
+                return 404, {}, {"detail": "Not found."}
+            elapsed = time.monotonic() - sim["created"]
+            if elapsed < self.sim_duration:
+                return 200, {"Retry-After": str(self.retry_after)}, {"progress": round(elapsed / self.sim_duration, 2)}
+            if "children" in sim:
+                return 200, {}, {"id": sim_id, "status": "COMPLETE", "children": sim["children"]}
+            return 200, {}, {"id": sim_id, "status": "COMPLETE", "alpha": sim["alpha"]}
+
+    def factor_returns(self, index):
+        if ("factor", index) not in self.pnl_returns:
+            rng = random.Random(f"factor-{index}")
+            self.pnl_returns[("factor", index)] = [rng.gauss(0, 1) for _ in range(self.pnl_days)]
+        return self.pnl_returns[("factor", index)]
+
+    def alpha_returns(self, alpha_id):
+        # 日 PnL = 公共因子 + 自身噪声，噪声越小与同因子 Alpha 的相关性越高
+        if alpha_id not in self.pnl_returns:
+            alpha  = self.alphas[alpha_id]
+            rng    = random.Random(alpha_id)
+            factor = self.factor_returns(zlib.crc32(alpha["regular"]["code"].encode()) % self.pnl_factors)
+            noise  = rng.uniform(0.3, 1.5)
+            self.pnl_returns[alpha_id] = [value + rng.gauss(0, noise) for value in factor]
+        return self.pnl_returns[alpha_id]
+
+    def alpha_pnl(self, alpha_id):
+        start = date(2024, 12, 31) - timedelta(days=self.pnl_days * 7 // 5)
+        days  = (start + timedelta(days=i) for i in itertools.count())
+        dates = [day.isoformat() for day in itertools.islice((day for day in days if day.weekday() < 5), self.pnl_days)]
+        pnl   = list(itertools.accumulate(self.alpha_returns(alpha_id)))
+        return {"schema": {"name": "pnl", "properties": [{"name": "date", "type": "date"}, {"name": "pnl", "type": "amount"}]},
+                "records": [[day, round(value * 1000, 2)] for day, value in zip(dates, pnl)]}
+
+    def self_correlation(self, alpha_id):
+        returns = self.alpha_returns(alpha_id)
+        best    = 0.0
+        for other in self.alphas.values():
+            if other["status"] == "ACTIVE" and other["id"] != alpha_id:
+                best = max(best, correlation(returns, self.alpha_returns(other["id"])))
+        return best
+
+    def alpha_check(self, alpha_id):
+        with self.lock:
+            alpha = self.alphas.get(alpha_id)
+            if alpha is None:
+                return 404, {}, {"detail": "Not found."}
+            self.touch(alpha_id)
+            started = self.checks.setdefault(alpha_id, time.monotonic())
+            if time.monotonic() - started < self.check_duration:
+                return 200, {"Retry-After": str(self.retry_after)}, None
+            del self.checks[alpha_id]
+            value  = round(self.self_correlation(alpha_id), 4)
+            checks = alpha["is"]["checks"] + [{"name": "SELF_CORRELATION", "result": "PASS" if value < 0.7 else "FAIL", "limit": 0.7, "value": value}]
+            return 200, {}, {"is": {"checks": checks}}
+
+    def alpha_list(self, query):
+        # 支持 status、order=-dateCreated 以及 is.xxx>v / is.xxx<v 形式的筛选
+        limit  = int(query.get("limit", 100))
+        offset = int(query.get("offset", 0))
+        status = query.get("status")
+        filters = []
+        for key in query:
+            match = re.fullmatch(r'is\.(\w+)([<>])([-\d.]+)', key)
+            if match:
+                filters.append((match.group(1), match.group(2), float(match.group(3))))
+        with self.lock:
+            alphas = [alpha for alpha in self.alphas.values() if not status or alpha["status"] == status]
+            for field, op, value in filters:
+                alphas = [alpha for alpha in alphas if (alpha["is"][field] > value if op == '>' else alpha["is"][field] < value)]
+            if query.get("order") == "-dateCreated":
+                alphas = sorted(alphas, key=lambda alpha: alpha["dateCreated"], reverse=True)
+            return {"count": len(alphas), "results": alphas[offset:offset + limit]}
+
+    def datafield_page(self, query, headers):
+        limit  = int(query.get("limit", 50))
+        offset = int(query.get("offset", 0))
+        etag   = f'"datafields-{len(self.datafields)}"'
+        if offset == 0 and headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, None
+        return 200, {"ETag": etag}, {"count": len(self.datafields), "results": self.datafields[offset:offset + limit]}
+
+    def route(self, method, path, query, headers, body):
+        """
+        返回 (status, headers, json_body)，json_body 为 None 时响应体为空。
+        """
+        segments = path.strip('/').split('/')
+        if method == "POST" and segments == ["authentication"]:
+            return 201, {}, {"user": {"id": "MOCK"}, "token": {"expiry": 14400}, "permissions": []}
+        if method == "POST" and segments == ["simulations"]:
+            sim_id = self.create_simulation(body)
+            if sim_id is None:
+                return 429, {}, {"detail": "CONCURRENT_SIMULATION_LIMIT_EXCEEDED"}
+            return 201, {"Location": f"{self.base_url}/simulations/{sim_id}", "Retry-After": str(self.retry_after)}, None
+        if method == "GET" and len(segments) == 2 and segments[0] == "simulations":
+            return self.simulation_progress(segments[1])
+        if method == "GET" and segments == ["data-fields"]:
+            return self.datafield_page(query, headers)
+        if method == "GET" and segments == ["users", "self", "alphas"]:
+            return 200, {}, self.alpha_list(query)
+        if len(segments) >= 2 and segments[0] == "alphas":
+            alpha_id = segments[1]
+            if len(segments) == 3 and segments[2] == "check" and method == "GET":
+                return self.alpha_check(alpha_id)
+            with self.lock:
+                alpha = self.alphas.get(alpha_id)
+                if alpha is None:
+                    return 404, {}, {"detail": "Not found."}
+                self.touch(alpha_id)
+                if len(segments) == 3 and segments[2] == "submit" and method == "POST":
+                    alpha["status"] = "ACTIVE"
+                    return 201, {}, None
+                if len(segments) == 2 and method == "PATCH":
+                    alpha.update({key: value for key, value in (body or {}).items() if key in ("color", "name", "tags")})
+                    return 200, {}, alpha
+                if len(segments) == 2 and method == "GET":
+                    return 200, {}, alpha
+                if segments[2:] == ["recordsets", "pnl"] and method == "GET":
+                    return 200, {}, self.alpha_pnl(alpha_id)
+        return 404, {}, {"detail": "Not found."}
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_request(self, method):
+                url    = urlparse(self.path)
+                query  = dict(parse_qsl(url.query, keep_blank_values=True))
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                raw    = self.rfile.read(length) if length else b""
+                body   = json.loads(raw) if raw else None
+
+                delay = server.latency + (server.rng.uniform(0, server.jitter) if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                endpoint = f"{method} /" + "/".join(seg if re.fullmatch(r'[a-z][a-z-]*', seg) else '{id}' for seg in url.path.strip('/').split('/'))
+                with server.lock:
+                    server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+                    roll = server.rng.random()
+
+                if roll < server.throttle_rate:
+                    status, headers, payload = 429, {"Retry-After": str(server.throttle_retry_after)}, {"detail": "API rate limit exceeded"}
+                elif roll < server.throttle_rate + server.failure_rate:
+                    status, headers, payload = 500, {}, {"detail": "Injected failure"}
+                else:
+                    status, headers, payload = server.route(method, url.path, query, self.headers, body)
+
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def do_PATCH(self):
+                self.handle_request("PATCH")
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--sim-duration", type=float, default=2)
+    parser.add_argument("--check-duration", type=float, default=1)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--concurrent-limit", type=int, default=None)
+    parser.add_argument("--datafield-count", type=int, default=500)
+    parser.add_argument("--alpha-count", type=int, default=200)
+    args = parser.parse_args()
+
+    server = MockBrainServer(args.host, args.port, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                             throttle_rate=args.throttle_rate, sim_duration=args.sim_duration, check_duration=args.check_duration,
+                             retry_after=args.retry_after, concurrent_limit=args.concurrent_limit,
+                             datafield_count=args.datafield_count, alpha_count=args.alpha_count)
+    print(f"Mock BRAIN server listening on {server.base_url}, run scripts with BRAIN_API_BASE={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
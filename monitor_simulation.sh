@@ -1,12 +1,15 @@
 #!/bin/bash
 
-# 定义日志文件和Python脚本的名称
-LOG_FILE="simulation.log"  # 需要监控的日志文件
+# 定义指标文件和Python脚本的名称
+STATS_FILE="simulation_stats.json"  # alpha_simulator.py 定期写入的指标文件
 PYTHON_SCRIPT="alpha_simulator.py"  # 需要运行的Python脚本
 MONITOR_LOG="monitor.log"  # 监控日志文件
 
-# 超时时间（单位：秒），如果日志文件超过此时间未更新，则重启脚本
-LOG_TIMEOUT=600
+CHECK_INTERVAL=10        # 检查间隔（单位：秒）
+STATS_TIMEOUT=30         # 指标文件超过此时间未更新，说明进程已退出或写入线程异常
+HEARTBEAT_TIMEOUT=180    # 心跳超过此时间未更新，说明主循环已挂起（BrainClient 在每次尝试和退避睡眠前都会更新心跳，两次心跳之间最长为单次请求超时 60 秒 + 最大退避 60 秒，再留出余量）
+PROGRESS_TIMEOUT=1800    # 有进行中的模拟但超过此时间没有任何模拟完成，说明轮询已卡住
+STARTUP_GRACE=60         # 启动后等待指标文件生成的时间
 
 # 先清空 monitor.log
 > "$MONITOR_LOG"
@@ -20,64 +23,89 @@ log_message() {
     echo "$timestamp - $level - $message" | tee -a "$MONITOR_LOG"
 }
 
-log_message "INFO" "Monitor script started. Log timeout set to $LOG_TIMEOUT seconds."
-
-# 进入无限循环，定期检查日志文件的更新时间
-while true; do
-    # 记录当前检测时间
-    log_message "INFO" "Checking log file status..."
-
-    # 如果日志文件不存在，重新启动 Python 脚本
-    if [ ! -f "$LOG_FILE" ]; then
-        log_message "WARNING" "Log file is missing. Restarting script..."
-        nohup python3 "$PYTHON_SCRIPT" > /dev/null 2>&1 &
-        NEW_PID=$!  # 获取刚启动的 Python 进程号
-        log_message "INFO" "$PYTHON_SCRIPT script started with PID: $NEW_PID"
-        sleep 5  # 等待脚本启动
-        continue  # 直接跳过本轮检查，进入下一轮循环
-    fi
-
-    # 获取日志文件的最后修改时间（以时间戳表示，单位为秒）
-    LAST_MODIFIED=$(stat -c %Y "$LOG_FILE")
-    # 获取当前时间（以时间戳表示，单位为秒）
-    CURRENT_TIME=$(date +%s)
-    # 计算当前时间与日志文件最后修改时间的时间差
-    TIME_DIFF=$((CURRENT_TIME - LAST_MODIFIED))
+start_script() {
+    # 启动前删除旧的指标文件，避免把上一个进程的指标当成新进程的
+    rm -f "$STATS_FILE"
+    nohup python3 "$PYTHON_SCRIPT" --stats-file "$STATS_FILE" > /dev/null 2>&1 &
+    NEW_PID=$!  # 获取刚启动的 Python 进程号
+    STARTED_AT=$(date +%s)
+    log_message "INFO" "$PYTHON_SCRIPT started with PID: $NEW_PID"
+}
 
-    log_message "INFO" "Log last modified $TIME_DIFF seconds ago."
+stop_script() {
+    local pid="$1"
+    # 进行中的模拟已记录在 alphas_queue.db 中，重启后会继续轮询，因此不需要等待模拟完成
+    log_message "INFO" "Sending SIGTERM to process $pid"
+    kill -TERM "$pid"
+    for _ in $(seq 1 10); do
+        ps -p "$pid" > /dev/null || return
+        sleep 1
+    done
+    log_message "CRITICAL" "Process did not exit after 10 seconds. Forcibly killing it..."
+    kill -9 "$pid"
+}
 
-    # 如果日志文件超过 LOG_TIMEOUT 秒未更新，则认为脚本可能已经挂起，需要重启
-    if [ "$TIME_DIFF" -gt "$LOG_TIMEOUT" ]; then
-        log_message "ERROR" "Log file stale for more than $LOG_TIMEOUT seconds. Restarting script..."
+# 读取指标文件，输出 "状态 说明"，状态为 OK / STALE_STATS / STALLED / NO_PROGRESS
+check_stats() {
+    python3 - "$STATS_FILE" "$STATS_TIMEOUT" "$HEARTBEAT_TIMEOUT" "$PROGRESS_TIMEOUT" <<'EOF'
+import json, sys, time
+stats_file, stats_timeout, heartbeat_timeout, progress_timeout = sys.argv[1], *map(float, sys.argv[2:])
+try:
+    with open(stats_file) as f:
+        stats = json.load(f)
+except (OSError, ValueError) as e:
+    print(f"STALE_STATS cannot read {stats_file}: {e}")
+    sys.exit()
+now = time.time()
+summary = (f"in_flight={stats['in_flight']} pending={stats['queue'].get('PENDING', 0)} completed={stats['completed']} "
+           f"rate={stats['completed_per_hour']}/h errors={stats['http_errors']} relogins={stats['relogins']}")
+if now - stats["updated_at"] > stats_timeout:
+    print(f"STALE_STATS stats not updated for {now - stats['updated_at']:.0f}s")
+elif now - stats["heartbeat"] > heartbeat_timeout:
+    print(f"STALLED heartbeat {now - stats['heartbeat']:.0f}s old, {summary}")
+elif stats["in_flight"] > 0 and now - stats["last_progress"] > progress_timeout:
+    print(f"NO_PROGRESS no simulation completed for {now - stats['last_progress']:.0f}s, {summary}")
+else:
+    print(f"OK {summary}")
+EOF
+}
 
-        # 获取正在运行的 Python 脚本的进程 ID
-        PYTHON_PID=$(pgrep -f "$PYTHON_SCRIPT")
+log_message "INFO" "Monitor script started. Heartbeat timeout $HEARTBEAT_TIMEOUT seconds, progress timeout $PROGRESS_TIMEOUT seconds."
+STARTED_AT=0
+LAST_REPORT=0
 
-        # 如果找到该进程，则进行终止处理
-        if [ -n "$PYTHON_PID" ]; then
-            log_message "INFO" "Sending SIGINT to process $PYTHON_PID"
-            kill -SIGINT "$PYTHON_PID"  # 发送 SIGINT 信号，尝试优雅终止进程
+# 进入无限循环，定期检查指标文件
+while true; do
+    PYTHON_PID=$(pgrep -f "$PYTHON_SCRIPT" | head -n 1)
+    NOW=$(date +%s)
+
+    # 进程不存在时直接重新启动
+    if [ -z "$PYTHON_PID" ]; then
+        log_message "WARNING" "$PYTHON_SCRIPT is not running. Starting script..."
+        start_script
+        sleep "$CHECK_INTERVAL"
+        continue
+    fi
 
-            TIMEOUT=300  # 设定最大等待时间 5 分钟（300 秒）
-            ELAPSED=0
+    # 刚启动的进程可能还没有写入指标文件
+    if [ ! -f "$STATS_FILE" ] && [ $((NOW - STARTED_AT)) -lt "$STARTUP_GRACE" ]; then
+        sleep "$CHECK_INTERVAL"
+        continue
+    fi
 
-            while ps -p "$PYTHON_PID" > /dev/null; do
-                if [ "$ELAPSED" -ge "$TIMEOUT" ]; then
-                    log_message "CRITICAL" "Process did not exit after 5 minutes. Forcibly killing it..."
-                    kill -9 "$PYTHON_PID"  # 强制终止进程
-                    break
-                fi
-                sleep 10  # 每 10 秒检查一次进程状态
-                ELAPSED=$((ELAPSED + 10))
-            done
+    read -r STATUS DETAIL <<< "$(check_stats)"
+    if [ "$STATUS" = "OK" ]; then
+        # 正常时每 5 分钟记录一次指标摘要
+        if [ $((NOW - LAST_REPORT)) -ge 300 ]; then
+            log_message "INFO" "Healthy: $DETAIL"
+            LAST_REPORT=$NOW
         fi
-
-        sleep 5  # 稍作等待，确保资源释放
-        # 重新启动 Python 脚本，并将输出重定向到 /dev/null 避免干扰
-        nohup python3 "$PYTHON_SCRIPT" > /dev/null 2>&1 &
-        NEW_PID=$!  # 获取新启动的 Python 进程号
-        log_message "INFO" "$PYTHON_SCRIPT restarted with PID: $NEW_PID"
+    else
+        log_message "ERROR" "$STATUS: $DETAIL. Restarting script..."
+        stop_script "$PYTHON_PID"
+        sleep 2  # 稍作等待，确保资源释放
+        start_script
     fi
 
-    sleep 300
+    sleep "$CHECK_INTERVAL"
 done
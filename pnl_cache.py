@@ -0,0 +1,166 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from auth_utils import API_BASE
+
+class PnlCache:
+    """
+    本地 PnL 缓存：/alphas/{id}/recordsets/pnl 返回的累计 PnL 按 Alpha 保存在 SQLite 中。
+    模拟完成后 IS PnL 不再变化，每个 Alpha 只请求一次，update() 只并发拉取缓存中还没有的 Alpha。
+
+    :param client     : BrainClient
+    :param db_path    : SQLite 数据库文件路径
+    :param max_workers: 并发拉取的线程数
+    """
+    def __init__(self, client, db_path: str = 'alpha_pnl.db', max_workers: int = 8):
+        self.client      = client
+        self.db_path     = db_path
+        self.max_workers = max_workers
+        self.lock        = threading.Lock()
+        self.conn        = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pnl (
+                alpha_id   TEXT PRIMARY KEY,
+                dates      TEXT NOT NULL,
+                pnl        BLOB NOT NULL,
+                fetched_at REAL
+            )
+        """)
+
+    def cached_ids(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT alpha_id FROM pnl")}
+
+    def fetch(self, alpha_id):
+        """
+        请求一个 Alpha 的 PnL，返回 (日期列表, 累计 PnL 数组)，失败时返回 None。
+        PnL 还在计算时服务端返回 Retry-After，由 wait_json 等待。
+        """
+        result = self.client.wait_json(f"{API_BASE}/alphas/{alpha_id}/recordsets/pnl")
+        if not result or not result.get("records"):
+            logging.warning(f"Get Alpha {alpha_id} PnL Fail.")
+            return None
+        names   = [prop["name"] for prop in result.get("schema", {}).get("properties", [])]
+        date_at = names.index("date") if "date" in names else 0
+        pnl_at  = names.index("pnl") if "pnl" in names else 1
+        records = result["records"]
+        return [record[date_at] for record in records], np.array([record[pnl_at] for record in records], dtype=np.float64)
+
+    def update(self, alpha_ids):
+        """
+        拉取缓存中还没有的 Alpha 的 PnL 并写入缓存，返回新拉取的数量。
+        """
+        cached  = self.cached_ids()
+        missing = [alpha_id for alpha_id in dict.fromkeys(alpha_ids) if alpha_id not in cached]
+        if not missing:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.fetch, missing))
+        rows = [(alpha_id, json.dumps(result[0]), result[1].tobytes(), time.time())
+                for alpha_id, result in zip(missing, results) if result is not None]
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("INSERT OR REPLACE INTO pnl VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute("COMMIT")
+        logging.info(f"Fetched PnL for {len(rows)}/{len(missing)} alphas, {len(cached) + len(rows)} alphas cached.")
+        return len(rows)
+
+    def load(self, alpha_ids):
+        """
+        返回 日期 x Alpha 的累计 PnL DataFrame，缓存中没有的 Alpha 不包含在内。
+        """
+        alpha_ids = list(dict.fromkeys(alpha_ids))
+        series    = {}
+        with self.lock:
+            for start in range(0, len(alpha_ids), 500):
+                chunk = alpha_ids[start:start + 500]
+                rows  = self.conn.execute(f"SELECT alpha_id, dates, pnl FROM pnl WHERE alpha_id IN ({','.join('?' * len(chunk))})",
+                                          chunk).fetchall()
+                for alpha_id, dates, pnl in rows:
+                    series[alpha_id] = pd.Series(np.frombuffer(pnl, dtype=np.float64), index=pd.to_datetime(json.loads(dates)))
+        if not series:
+            return pd.DataFrame()
+        return pd.DataFrame(series).sort_index()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class SelfCorrelation:
+    """
+    用缓存的 PnL 在本地估计候选 Alpha 与已提交 Alpha 的最大自相关，代替逐个等待远程 /check。
+    与 BRAIN 的 SELF_CORRELATION 一样使用最近 years 年的日 PnL 变化计算相关系数。
+    每列去均值并归一化为单位长度 (缺失的日期记为 0) 后，所有候选与所有已提交 Alpha 的相关系数是一次矩阵乘法。
+    缺失日期的处理与服务端不完全相同，结果是估计值，通过预检查的 Alpha 仍需远程 /check 确认。
+
+    :param cache    : PnlCache
+    :param threshold: 自相关上限，超过时不再发送远程 /check
+    :param years    : 计算相关系数使用的年数
+    """
+    def __init__(self, cache, threshold: float = 0.7, years: int = 4):
+        self.cache     = cache
+        self.threshold = threshold
+        self.years     = years
+        self.submitted = []
+
+    def set_submitted(self, alpha_ids):
+        """
+        设置已提交 Alpha 集合并拉取缺少的 PnL。
+        """
+        self.submitted = list(alpha_ids)
+        self.cache.update(self.submitted)
+
+    def returns_matrix(self, alpha_ids):
+        # 日期 x Alpha 的日 PnL 变化，每列去均值并归一化为单位长度
+        frame = self.cache.load(alpha_ids)
+        if frame.empty:
+            return [], np.zeros((0, 0))
+        frame   = frame[frame.index > frame.index.max() - pd.DateOffset(years=self.years)]
+        returns = frame.ffill().diff().iloc[1:].to_numpy()
+        valid   = np.isfinite(returns)
+        count   = np.maximum(valid.sum(axis=0), 1)
+        returns = np.where(valid, returns - np.where(valid, returns, 0).sum(axis=0) / count, 0)
+        norm    = np.linalg.norm(returns, axis=0)
+        return list(frame.columns), np.divide(returns, norm, out=np.zeros_like(returns), where=norm > 0)
+
+    def screen(self, alphas, greedy: bool = False):
+        """
+        返回 (可能通过的 Alpha 列表, {alpha_id: (最大相关系数, 最相关的 Alpha id)})。
+        greedy=True 时 (提交模式) 先通过的候选也加入比较集合，同一批中相互高度相关的候选只保留第一个。
+        拉取不到 PnL 的候选直接放行。
+        """
+        candidate_ids = [alpha.get("id") for alpha in alphas]
+        self.cache.update(candidate_ids)
+        ids, matrix = self.returns_matrix(self.submitted + candidate_ids)
+        position    = {alpha_id: i for i, alpha_id in enumerate(ids)}
+        reference   = [position[alpha_id] for alpha_id in dict.fromkeys(self.submitted) if alpha_id in position]
+        present     = [alpha_id for alpha_id in dict.fromkeys(candidate_ids) if alpha_id in position]
+        columns     = reference + [position[alpha_id] for alpha_id in present]
+        corr        = matrix[:, columns[len(reference):]].T @ matrix[:, columns]
+        corr[:, len(reference):][np.eye(len(present), dtype=bool)] = 0
+
+        # 提交模式下候选 i 只与已提交 Alpha 和在它之前通过的候选比较
+        compare = np.r_[np.ones(len(reference), dtype=bool), np.zeros(len(present), dtype=bool)]
+        row     = {alpha_id: i for i, alpha_id in enumerate(present)}
+        passed, rejected = [], {}
+        for alpha in alphas:
+            i = row.get(alpha.get("id"))
+            if i is None:
+                passed.append(alpha)
+                continue
+            values = np.where(compare, corr[i], -np.inf)
+            best   = int(np.argmax(values)) if compare.any() else None
+            if best is not None and values[best] > self.threshold:
+                rejected[alpha.get("id")] = (round(float(values[best]), 4), ids[columns[best]])
+                continue
+            if greedy:
+                compare[len(reference) + i] = True
+            passed.append(alpha)
+        return passed, rejected
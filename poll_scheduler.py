@@ -0,0 +1,74 @@
+import heapq
+import itertools
+import time
+
+class PollScheduler:
+    """
+    按 Retry-After 计算下次轮询时间的调度器。
+    每个进行中的模拟以下次到期时间为键保存在最小堆中，
+    调用方只需睡眠到最早的到期时间，再取出到期的模拟进行轮询。
+    同时统计每个完成的模拟平均轮询次数以及空闲名额秒数 (idle slot-seconds)。
+
+    :param default_delay: 没有 Retry-After 时的默认轮询间隔
+    :param min_delay    : 最小轮询间隔，避免 Retry-After 过小导致频繁请求
+    :param max_delay    : 最大轮询间隔
+    """
+    def __init__(self, default_delay: float = 3, min_delay: float = 0.5, max_delay: float = 60):
+        self.default_delay = default_delay
+        self.min_delay     = min_delay
+        self.max_delay     = max_delay
+        self.heap          = []
+        self.counter       = itertools.count()
+        self.polls         = 0
+        self.completed     = 0
+        self.idle_slot_seconds = 0.0
+        self.busy_slot_seconds = 0.0
+        self.slot_used     = 0
+        self.slot_capacity = 0
+        self.slot_time     = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def clamp(self, delay):
+        if delay is None:
+            delay = self.default_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def schedule(self, key, delay=None):
+        heapq.heappush(self.heap, (time.monotonic() + self.clamp(delay), next(self.counter), key))
+
+    def pop_due(self):
+        now, due = time.monotonic(), []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
+
+    def time_until_next(self):
+        if not self.heap:
+            return None
+        return max(self.heap[0][0] - time.monotonic(), 0)
+
+    def record_poll(self, finished: bool = False):
+        self.polls += 1
+        if finished:
+            self.completed += 1
+
+    def observe_slots(self, used: int, capacity: int):
+        # 以上一次观测的占用情况累加空闲 / 占用名额秒数
+        now = time.monotonic()
+        if self.slot_time is not None:
+            elapsed = now - self.slot_time
+            self.idle_slot_seconds += max(self.slot_capacity - self.slot_used, 0) * elapsed
+            self.busy_slot_seconds += min(self.slot_used, self.slot_capacity) * elapsed
+        self.slot_used, self.slot_capacity, self.slot_time = used, capacity, now
+
+    def stats(self):
+        total_slot_seconds = self.idle_slot_seconds + self.busy_slot_seconds
+        return {
+            "polls": self.polls,
+            "completed": self.completed,
+            "polls_per_completed": self.polls / self.completed if self.completed else None,
+            "idle_slot_seconds": round(self.idle_slot_seconds, 2),
+            "slot_utilization": self.busy_slot_seconds / total_slot_seconds if total_slot_seconds else None,
+        }
@@ -0,0 +1,145 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+class ResultStore:
+    """
+    本地模拟结果库，保存 /alphas/{id} 返回的完整 IS 指标和 settings。
+    写入先进入缓冲区，达到 batch_size 条或距上次写入超过 flush_interval 秒时批量提交。
+    query 在本地按 Sharpe / Fitness / Turnover 等条件向量化筛选，不需要分页请求 API。
+
+    :param db_path       : SQLite 数据库文件路径
+    :param batch_size    : 缓冲区达到该数量时写入
+    :param flush_interval: 距上次写入超过该秒数时写入
+    """
+    COLUMNS = ["id", "code", "status", "settings", "date_created", "sharpe", "fitness", "turnover",
+               "returns", "drawdown", "margin", "has_fail", "checks", "raw"]
+
+    def __init__(self, db_path: str = 'alpha_results.db', batch_size: int = 50, flush_interval: float = 30):
+        self.db_path        = db_path
+        self.batch_size     = batch_size
+        self.flush_interval = flush_interval
+        self.buffer         = []
+        self.last_flush     = time.time()
+        self.lock           = threading.Lock()
+        self.conn           = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                id           TEXT PRIMARY KEY,
+                code         TEXT,
+                status       TEXT,
+                settings     TEXT,
+                date_created TEXT,
+                sharpe       REAL,
+                fitness      REAL,
+                turnover     REAL,
+                returns      REAL,
+                drawdown     REAL,
+                margin       REAL,
+                has_fail     INTEGER,
+                checks       TEXT,
+                raw          TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_results_status ON results (status, date_created)")
+
+    @staticmethod
+    def to_row(result):
+        metrics = result.get("is") or {}
+        checks  = metrics.get("checks") or []
+        regular = result.get("regular")
+        code    = regular.get("code") if isinstance(regular, dict) else regular
+        return (
+            result.get("id"), code, result.get("status"), json.dumps(result.get("settings")),
+            result.get("dateCreated"), metrics.get("sharpe"), metrics.get("fitness"), metrics.get("turnover"),
+            metrics.get("returns"), metrics.get("drawdown"), metrics.get("margin"),
+            int(any(check.get("result") == "FAIL" for check in checks)), json.dumps(checks), json.dumps(result),
+        )
+
+    def add(self, result):
+        if not result.get("id"):
+            return
+        with self.lock:
+            self.buffer.append(self.to_row(result))
+            due = len(self.buffer) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def add_many(self, results):
+        for result in results:
+            self.add(result)
+
+    def flush(self):
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+            self.last_flush = time.time()
+            if not rows:
+                return
+            placeholders = ", ".join("?" * len(self.COLUMNS))
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(f"INSERT OR REPLACE INTO results ({', '.join(self.COLUMNS)}) VALUES ({placeholders})", rows)
+            self.conn.execute("COMMIT")
+        logging.info(f"Flushed {len(rows)} results to {self.db_path}.")
+
+    def update_status(self, alpha_id: str, status: str):
+        with self.lock:
+            self.conn.execute("UPDATE results SET status = ? WHERE id = ?", (status, alpha_id))
+
+    def count_codes(self, codes):
+        """
+        返回结果库中已有结果的表达式数量 (按 code 精确匹配)，用于判断一批 Alpha 的模拟结果是否已经写入。
+        """
+        codes, count = list(dict.fromkeys(codes)), 0
+        with self.lock:
+            for start in range(0, len(codes), 500):
+                chunk  = codes[start:start + 500]
+                count += self.conn.execute(f"SELECT COUNT(DISTINCT code) FROM results WHERE code IN ({', '.join('?' * len(chunk))})", chunk).fetchone()[0]
+        return count
+
+    def import_results(self, results):
+        """
+        导入 API 返回的 Alpha 列表 (例如 /users/self/alphas 的 results)，用于回填历史数据。
+        """
+        self.add_many(results)
+        self.flush()
+
+    def load_frame(self, status: str = None, columns=None):
+        columns       = columns or ["id", "status", "date_created", "sharpe", "fitness", "turnover", "has_fail"]
+        query, params = f"SELECT {', '.join(column for column in columns if column in self.COLUMNS)} FROM results", ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        with self.lock:
+            return pd.read_sql_query(query, self.conn, params=params)
+
+    def query(self, status: str = "UNSUBMITTED", fitness_min: float = 1, sharpe_min: float = 1.25,
+              turnover_min: float = 0.01, turnover_max: float = 0.7, exclude_fail: bool = True):
+        """
+        向量化筛选本地结果，返回与 /users/self/alphas 相同格式的 Alpha 字典列表 (按 dateCreated 倒序)。
+        """
+        self.flush()
+        df   = self.load_frame(status)
+        mask = (df["fitness"] > fitness_min) & (df["sharpe"] > sharpe_min) & \
+               (df["turnover"] > turnover_min) & (df["turnover"] < turnover_max)
+        if exclude_fail:
+            mask &= df["has_fail"] == 0
+        ids = df.loc[mask].sort_values("date_created", ascending=False)["id"].tolist()
+        if not ids:
+            return []
+
+        raw = {}
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows  = self.conn.execute(f"SELECT id, raw FROM results WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+                raw.update((alpha_id, json.loads(data)) for alpha_id, data in rows)
+        return [raw[alpha_id] for alpha_id in ids]
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,189 @@
+import json
+import logging
+import re
+import string
+import numpy as np
+from alpha_dedupe import normalize_expression, fingerprint
+
+class Template:
+    """
+    一个 Alpha 模板：expression 为 str.format 格式的表达式，parameters 为每个占位符的取值列表。
+    维度顺序与配置文件中 parameters 的顺序一致。
+
+    :param name      : 模板名称
+    :param expression: 表达式模板，例如 "{gco}(rank({field}), {grp})"
+    :param parameters: {占位符: [取值, ...]}
+    :param settings  : 该模板使用的 simulation settings
+    """
+    def __init__(self, name: str, expression: str, parameters: dict, settings: dict):
+        self.name       = name
+        self.expression = expression
+        self.settings   = settings
+        fields          = [field for _, field, _, _ in string.Formatter().parse(expression) if field]
+        missing         = set(fields) - set(parameters)
+        if missing:
+            raise ValueError(f"Template {name} has no values for {sorted(missing)}")
+        self.names      = [key for key in parameters if key in fields]
+        self.dimensions = [list(parameters[key]) for key in self.names]
+        self.pattern    = self.build_pattern()
+
+    def __len__(self):
+        total = 1
+        for dim in self.dimensions:
+            total *= len(dim)
+        return total
+
+    def render(self, values):
+        return self.expression.format(**dict(zip(self.names, values)))
+
+    def build_pattern(self):
+        """
+        把模板转成匹配规范化表达式 (去掉空白) 的正则，每个占位符为其取值的命名分组，
+        用于把本地结果库中的模拟结果归因到模板的各个取值上。
+        """
+        values = dict(zip(self.names, self.dimensions))
+        parts, seen = [], set()
+        for literal, field, _, _ in string.Formatter().parse(self.expression):
+            parts.append(re.escape(normalize_expression(literal)))
+            if not field:
+                continue
+            if field in seen:
+                parts.append(f"(?P={field})")
+                continue
+            seen.add(field)
+            alternatives = sorted({normalize_expression(str(value)) for value in values[field]}, key=len, reverse=True)
+            parts.append(f"(?P<{field}>{'|'.join(re.escape(value) for value in alternatives)})")
+        return "^" + "".join(parts) + "$"
+
+def load_search_space(path: str, base_settings: dict, datafield_loader=None):
+    """
+    读取搜索空间配置文件，返回 Template 列表。格式：
+    {
+        "settings": {...},                      # 可选，覆盖默认 settings
+        "templates": [{
+            "name": "...",
+            "expression": "{op}(rank({field}), {grp})",
+            "settings": {...},                  # 可选，覆盖该模板的 settings
+            "parameters": {
+                "op": ["group_rank", "group_zscore"],
+                "field": {"datafields": {"dataset": "fundamental6", "type": "MATRIX"}},
+                "grp": ["industry", "sector"]
+            }
+        }]
+    }
+    取值为 {"datafields": {...}} 时通过 datafield_loader 展开为数据字段 id 列表。
+
+    :param path            : 配置文件路径 (JSON)
+    :param base_settings   : 默认 settings
+    :param datafield_loader: 函数 (spec dict) -> 数据字段 id 列表
+    """
+    with open(path) as f:
+        config = json.load(f)
+    settings  = {**base_settings, **config.get("settings", {})}
+    templates = []
+    for item in config["templates"]:
+        parameters = {}
+        for name, values in item["parameters"].items():
+            if isinstance(values, dict) and "datafields" in values:
+                if datafield_loader is None:
+                    raise ValueError(f"Template {item['name']} parameter {name} needs a datafield loader")
+                values = datafield_loader(values["datafields"])
+            parameters[name] = values
+        templates.append(Template(item["name"], item["expression"], parameters, {**settings, **item.get("settings", {})}))
+    return templates
+
+class BanditSampler:
+    """
+    按已完成的模拟结果分配剩余的模拟预算。
+    每个模板、每个模板的每个维度的每个取值都是一个 arm，奖励为 min(sharpe / sharpe_target, fitness / fitness_target)
+    截断到 [0, 1]，两个指标都达标时为 1。每次采样对模板和各维度分别做 Thompson sampling (Beta 后验)，
+    未模拟过的取值使用 Beta(1, 1) 先验，保证仍有探索。
+    结果通过模板正则从 ResultStore 的 code 列归因，refresh() 重新读取结果库更新后验。
+
+    :param templates     : Template 列表
+    :param result_store  : ResultStore
+    :param fingerprints  : FingerprintIndex，跳过已经入队或模拟过的组合
+    :param sharpe_target : 奖励为 1 所需的 Sharpe
+    :param fitness_target: 奖励为 1 所需的 Fitness
+    :param seed          : 随机种子
+    """
+    def __init__(self, templates, result_store, fingerprints=None, sharpe_target: float = 1.25, fitness_target: float = 1.0, seed=None):
+        self.templates      = templates
+        self.result_store   = result_store
+        self.fingerprints   = fingerprints
+        self.sharpe_target  = sharpe_target
+        self.fitness_target = fitness_target
+        self.rng            = np.random.default_rng(seed)
+        self.seen           = set()
+        self.index          = [[{normalize_expression(str(value)): i for i, value in enumerate(dim)} for dim in t.dimensions] for t in templates]
+        self.reset()
+
+    def reset(self):
+        self.template_rewards = np.zeros(len(self.templates))
+        self.template_counts  = np.zeros(len(self.templates))
+        self.rewards          = [[np.zeros(len(dim)) for dim in t.dimensions] for t in self.templates]
+        self.counts           = [[np.zeros(len(dim)) for dim in t.dimensions] for t in self.templates]
+
+    def refresh(self):
+        """
+        从结果库重新计算每个 arm 的奖励和次数，返回归因到模板的结果数量。
+        """
+        self.reset()
+        df = self.result_store.load_frame(columns=["code", "sharpe", "fitness"])
+        if df.empty:
+            return 0
+        codes  = df["code"].fillna("").str.replace(r"\s+", "", regex=True)
+        reward = np.minimum(df["sharpe"] / self.sharpe_target, df["fitness"] / self.fitness_target).clip(0, 1).fillna(0)
+        matched_total = 0
+        for t_index, template in enumerate(self.templates):
+            matches = codes.str.extract(template.pattern)
+            matched = matches.notna().all(axis=1)
+            if not matched.any():
+                continue
+            matched_total += int(matched.sum())
+            self.template_rewards[t_index] = reward[matched].sum()
+            self.template_counts[t_index]  = matched.sum()
+            for d_index, name in enumerate(template.names):
+                grouped = reward[matched].groupby(matches.loc[matched, name]).agg(["sum", "count"])
+                lookup  = self.index[t_index][d_index]
+                for value, row in grouped.iterrows():
+                    if value in lookup:
+                        self.rewards[t_index][d_index][lookup[value]] = row["sum"]
+                        self.counts[t_index][d_index][lookup[value]]  = row["count"]
+        logging.info(f"Bandit sampler attributed {matched_total} of {len(df)} results to {len(self.templates)} templates.")
+        return matched_total
+
+    def draw(self, rewards, counts):
+        return int(np.argmax(self.rng.beta(1 + rewards, 1 + counts - rewards)))
+
+    def sample(self, n: int, max_attempts: int = 50):
+        """
+        采样 n 个未入队、未模拟过的 Alpha；搜索空间接近穷尽时可能少于 n 个。
+        """
+        alphas, attempts = [], 0
+        while len(alphas) < n and attempts < n * max_attempts:
+            attempts += 1
+            t_index  = self.draw(self.template_rewards, self.template_counts)
+            template = self.templates[t_index]
+            values   = [dim[self.draw(self.rewards[t_index][d], self.counts[t_index][d])] for d, dim in enumerate(template.dimensions)]
+            expression = template.render(values)
+            key = fingerprint(expression, template.settings)
+            if key in self.seen or (self.fingerprints is not None and self.fingerprints.contains(expression, template.settings)):
+                continue
+            self.seen.add(key)
+            alphas.append({'type': 'REGULAR', 'settings': template.settings, 'regular': expression})
+        return alphas
+
+    def report(self, top: int = 5):
+        """
+        每个模板每个维度平均奖励最高的取值，用于日志。
+        """
+        report = {}
+        for t_index, template in enumerate(self.templates):
+            report[template.name] = {}
+            for d_index, (name, dim) in enumerate(zip(template.names, template.dimensions)):
+                counts = self.counts[t_index][d_index]
+                means  = np.divide(self.rewards[t_index][d_index], counts, out=np.zeros_like(counts), where=counts > 0)
+                order  = np.argsort(-means)[:top]
+                report[template.name][name] = [(dim[i], round(float(means[i]), 3), int(counts[i])) for i in order if counts[i] > 0]
+        return report
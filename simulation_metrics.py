@@ -0,0 +1,193 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Histogram:
+    """
+    固定分桶的延迟直方图 (秒)，p50 / p99 取所在分桶的上界。
+    """
+    BOUNDS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf')]
+
+    def __init__(self):
+        self.counts = [0] * len(self.BOUNDS)
+        self.total  = 0
+        self.sum    = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.total += 1
+        self.sum   += value
+
+    def quantile(self, q: float):
+        if not self.total:
+            return None
+        target, seen = q * self.total, 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.BOUNDS[-1]
+
+    def snapshot(self):
+        return {
+            "count": self.total,
+            "avg": round(self.sum / self.total, 3) if self.total else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {f"le_{bound}": count for bound, count in zip(self.BOUNDS, self.counts)},
+        }
+
+class SimulationMetrics:
+    """
+    Simulator 的运行指标：队列深度、进行中的模拟数、完成速率、提交 / 轮询延迟直方图、错误数、重新登录次数和心跳。
+    start() 后由后台线程每 interval 秒把快照原子地写入 stats_file，指定 port 时同时在 127.0.0.1:port/metrics 提供 JSON。
+    heartbeat 只由主循环 (或事件循环) 更新，写入线程仍在运行但 heartbeat 不再变化说明主循环已挂起，
+    monitor_simulation.sh 根据这些信号判断是否需要重启。
+
+    :param simulator : AlphaSimulator，用于读取队列、进行中的模拟和 BrainClient 统计
+    :param stats_file: 指标文件路径，None 表示不写文件
+    :param interval  : 写入间隔 (秒)
+    :param port      : HTTP 端口，None 表示不启动
+    :param window    : 计算完成速率的滑动窗口 (秒)
+    """
+    def __init__(self, simulator, stats_file: str = 'simulation_stats.json', interval: float = 5, port: int = None, window: float = 600):
+        self.simulator     = simulator
+        self.stats_file    = stats_file
+        self.interval      = interval
+        self.port          = port
+        self.window        = window
+        self.lock          = threading.Lock()
+        self.started_at    = time.time()
+        self.heartbeat     = self.started_at
+        self.last_progress = self.started_at
+        self.submitted     = 0
+        self.completed     = 0
+        self.submit_errors = 0
+        self.poll_errors   = 0
+        self.completions   = deque()
+        self.submit_hist   = Histogram()
+        self.poll_hist     = Histogram()
+        self.stop_event    = threading.Event()
+        self.httpd         = None
+
+    def beat(self):
+        self.heartbeat = time.time()
+
+    def record_submit(self, latency: float, ok: bool, count: int = 1):
+        with self.lock:
+            self.submit_hist.observe(latency)
+            if ok:
+                self.submitted += count
+            else:
+                self.submit_errors += 1
+
+    def record_poll(self, latency: float, ok: bool):
+        with self.lock:
+            self.poll_hist.observe(latency)
+            if not ok:
+                self.poll_errors += 1
+
+    def record_completed(self, count: int):
+        now = time.time()
+        with self.lock:
+            self.completed    += count
+            self.last_progress = now
+            self.completions.append((now, count))
+
+    def snapshot(self):
+        now    = time.time()
+        client = self.simulator.client
+        with self.lock:
+            while self.completions and now - self.completions[0][0] > self.window:
+                self.completions.popleft()
+            window   = min(self.window, max(now - self.started_at, 1e-9))
+            recent   = sum(count for _, count in self.completions)
+            snapshot = {
+                "pid": os.getpid(),
+                "updated_at": now,
+                "started_at": self.started_at,
+                "heartbeat": self.heartbeat,
+                "heartbeat_age": round(now - self.heartbeat, 1),
+                "last_progress": self.last_progress,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "completed_per_hour": round(recent * 3600 / window, 1),
+                "submit_errors": self.submit_errors,
+                "poll_errors": self.poll_errors,
+                "submit_latency": self.submit_hist.snapshot(),
+                "poll_latency": self.poll_hist.snapshot(),
+            }
+        client_stats = client.stats_report() if hasattr(client, "stats_report") else {}
+        sessions     = getattr(client, "sessions", None)
+        snapshot.update({
+            "queue": self.simulator.queue.counts(),
+            "in_flight": len(self.simulator.active_simulations),
+            "max_concurrent": self.simulator.max_concurrent,
+            "buffered": len(self.simulator.sim_queue_ls),
+            "http_errors": sum(stat["errors"] for stat in client_stats.values()),
+            "http_retries": sum(stat["retries"] for stat in client_stats.values()),
+            "relogins": max(getattr(sessions, "login_count", 0) - 1, 0),
+            "poll_stats": self.simulator.scheduler.stats(),
+        })
+        return snapshot
+
+    def write(self):
+        tmp_file = self.stats_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_file, self.stats_file)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                if self.stats_file:
+                    self.write()
+            except Exception as e:
+                logging.warning(f"Failed to write simulation stats: {e}")
+
+    def serve(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('/metrics', '/health'):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                data = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        logging.info(f"Simulation metrics available at http://127.0.0.1:{self.httpd.server_address[1]}/metrics")
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        if self.port is not None:
+            self.serve()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.stats_file:
+            try:
+                self.write()
+            except Exception as e:
+                logging.warning(f"Failed to write simulation stats: {e}")
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None